@@ -0,0 +1,135 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Flowable
+
+from instrumentation import count
+
+
+class SharedImageReader(ImageReader):
+    # An ImageReader that threads may draw from at once. Reportlab decodes the pixels on first use and reads JPEG
+    # data back through one shared file object, so decoding is done under a lock and every JPEG read gets a file
+    # of its own.
+
+    def __init__(self, data):
+        super().__init__(io.BytesIO(data))
+        self.data = data
+        self.lock = threading.Lock()
+        if getattr(self._image, 'format', None) == 'JPEG':
+            self.jpeg_fh = self.jpeg_file
+
+    def jpeg_file(self):
+        return io.BytesIO(self.data)
+
+    def getRGBData(self):
+        if self._data is None:
+            with self.lock:
+                super().getRGBData()
+                if self._dataA is not None:
+                    self._dataA.getRGBData()
+        return self._data
+
+
+class Asset:
+
+    def __init__(self, path, data, mtime=None):
+        self.path = path
+        # Modification time of the file the asset was read from, None for images that come from elsewhere
+        self.mtime = mtime
+        # Encoded file contents, decoded at most once by the shared reader
+        self.data = data
+        self.reader = SharedImageReader(data)
+        self.width, self.height = self.reader.getSize()
+        self.digest = hashlib.md5(data).hexdigest()
+        self.form_name = 'Asset' + self.digest
+
+    def scaled(self, width):
+        return width, width * self.height / self.width
+
+    def draw(self, canv, x, y, width, height):
+        # Register the image once per document as a unit-square form, so later draws don't hash the pixels again
+        if not canv.hasForm(self.form_name):
+            canv.beginForm(self.form_name, 0, 0, 1, 1)
+            canv.drawImage(self.reader, 0, 0, 1, 1, mask='auto')
+            canv.endForm()
+        canv.saveState()
+        canv.translate(x, y)
+        canv.scale(width, height)
+        canv.doForm(self.form_name)
+        canv.restoreState()
+
+
+class AssetRegistry:
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, path):
+        key = os.path.abspath(path)
+        # A stat is much cheaper than an open and decode, and drops entries whose file has changed
+        mtime = os.stat(key).st_mtime_ns
+        with self.lock:
+            asset = self.entries.get(key)
+            cached = asset is not None and asset.mtime == mtime
+            if cached:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        if cached:
+            count('images_cached')
+            return asset
+        with open(key, 'rb') as f:
+            asset = Asset(path, f.read(), mtime)
+        with self.lock:
+            self.entries[key] = asset
+            self.entries.move_to_end(key)
+            self.loads += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        count('images_loaded')
+        return asset
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+registry = AssetRegistry()
+
+
+def get_asset(path):
+    return registry.get(path)
+
+
+class AssetImage(Flowable):
+    # Stands in for platypus Image, which opens and decodes the file again for every instance
+
+    def __init__(self, asset, width, hAlign='CENTER'):
+        super().__init__()
+        self.asset = asset
+        self.drawWidth, self.drawHeight = asset.scaled(width)
+        self.hAlign = hAlign
+
+    def wrap(self, avail_width, avail_height):
+        return self.drawWidth, self.drawHeight
+
+    def draw(self):
+        self.asset.draw(self.canv, 0, 0, self.drawWidth, self.drawHeight)
+
+
+def bind_paragraph_images(paragraph, assets=None):
+    # Point <img> tags at the shared readers so their pixels are decoded once per process, not once per paragraph.
+    # Given assets replace the images in the order of the tags, whatever file they name.
+    assets = iter(assets) if assets is not None else None
+    for frag in paragraph.frags:
+        definition = getattr(frag, 'cbDefn', None)
+        if definition is not None and getattr(definition, 'kind', None) == 'img':
+            definition.image = (next(assets) if assets is not None else get_asset(definition.src)).reader
+    return paragraph
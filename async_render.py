@@ -0,0 +1,95 @@
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+CHUNK_SIZE = 64 * 1024
+# Number of recent queue waits kept for the percentiles in metrics()
+WAIT_SAMPLES = 1024
+
+
+def _render(template_class, data, options):
+    return template_class(response_type='bytes', **options).generate(data)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+class AsyncRenderer:
+    # Renders on a bounded executor so the event loop stays free. Worker processes by default, since rendering
+    # is pure Python and would hold the GIL from a thread. threads uses a thread pool instead, which overlaps only
+    # image decoding, compression and writes with layout but needs no pickling and shares the caches.
+
+    def __init__(self, max_workers=None, max_pending=None, executor=None, threads=False):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # Renders allowed to wait for a worker before new ones are turned away with asyncio.QueueFull
+        self.max_pending = self.max_workers * 4 if max_pending is None else max_pending
+        self.executor = executor or (ThreadPoolExecutor if threads else ProcessPoolExecutor)(self.max_workers)
+        self.owns_executor = executor is None
+        self.slots = asyncio.Semaphore(self.max_workers)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.max_wait = 0.0
+
+    async def render(self, template_class, data, **options):
+        if self.waiting >= self.max_pending:
+            self.rejected += 1
+            raise asyncio.QueueFull('{:} renders already waiting'.format(self.waiting))
+        loop = asyncio.get_running_loop()
+        queued = loop.time()
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            wait = loop.time() - queued
+            self.waits.append(wait)
+            self.max_wait = max(self.max_wait, wait)
+            self.running += 1
+            try:
+                pdf = await loop.run_in_executor(self.executor, _render, template_class, data, options)
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.running -= 1
+            self.completed += 1
+            return pdf
+        finally:
+            self.slots.release()
+
+    async def stream(self, template_class, data, chunk_size=CHUNK_SIZE, **options):
+        # Async iterator over the PDF bytes, e.g. for a streaming HTTP response
+        pdf = memoryview(await self.render(template_class, data, **options))
+        for start in range(0, len(pdf), chunk_size):
+            yield pdf[start:start + chunk_size]
+
+    def metrics(self):
+        waits = list(self.waits)
+        return {
+            'queue_depth': self.waiting,
+            'running': self.running,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'wait_p50_ms': _percentile(waits, 0.5) * 1000,
+            'wait_p99_ms': _percentile(waits, 0.99) * 1000,
+            'wait_max_ms': self.max_wait * 1000,
+        }
+
+    def close(self):
+        if self.owns_executor:
+            self.executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
@@ -0,0 +1,214 @@
+import os
+import threading
+import traceback
+from collections import deque, namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from bundles import BundleWriter
+from journal import Journal
+
+PER_RECORD = 'per-record'
+COMBINED = 'combined'
+BUNDLE = 'bundle'
+
+# skipped marks records a journal shows were finished by an earlier run
+RenderResult = namedtuple('RenderResult', ['index', 'filename', 'error', 'skipped'], defaults=(False,))
+
+
+def record_key(payload, index, key):
+    # key is a dotted path into the payload such as vehicle.fuel_card_no, or None to use the record index
+    if key is None:
+        return index
+    value = payload
+    for name in key.split('.'):
+        value = value[name]
+    return value
+
+
+def _partial_filename(filename):
+    return '{:}.{:}.{:}.part'.format(filename, os.getpid(), threading.get_ident())
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
+
+
+def _render_record(template_class, index, payload, filename, template_options):
+    # Runs inside a worker process, so failures are reported rather than raised. The PDF is written under a
+    # temporary name and renamed once complete, so a crash never leaves a truncated file under the real name.
+    partial = _partial_filename(filename)
+    try:
+        template_class(response_type='file', filename=partial, **template_options).generate(payload)
+        os.replace(partial, filename)
+    except Exception:
+        _remove(partial)
+        return RenderResult(index, filename, traceback.format_exc())
+    return RenderResult(index, filename, None)
+
+
+def _finish(key, future, journal):
+    result = future.result()
+    if journal is not None and result.error is None and not result.skipped:
+        journal.record(key, result.index, result.filename)
+    return result
+
+
+def _iter_per_record(template_class, payloads, output_dir, filename_pattern, workers, template_options, journal,
+                     select, threads):
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    journal = Journal(journal) if journal is not None else None
+    # Threads share the process's caches and skip pickling payloads, but only overlap the image decoding,
+    # compression and file writes that release the GIL
+    executor_class = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    try:
+        with executor_class(max_workers=workers) as executor:
+            # Keep a bounded window of pending renders so large iterables are not submitted all at once
+            pending = deque()
+            for index, payload in enumerate(payloads):
+                if select is not None and not select(index, payload):
+                    continue
+                filename = os.path.join(output_dir, filename_pattern.format(index=index))
+                key = Journal.key(payload, template_options) if journal is not None else None
+                if journal is not None and journal.finished(key, filename):
+                    future = Future()
+                    future.set_result(RenderResult(index, filename, None, True))
+                else:
+                    future = executor.submit(_render_record, template_class, index, payload, filename,
+                                             template_options)
+                pending.append((key, future))
+                if len(pending) >= workers * 2:
+                    yield _finish(*pending.popleft(), journal)
+            while pending:
+                yield _finish(*pending.popleft(), journal)
+    finally:
+        if journal is not None:
+            journal.close()
+
+
+def _render_bytes(template_class, payload, template_options):
+    # Runs inside a worker, the PDF comes back to be written into the bundle
+    try:
+        return template_class(response_type='bytes', **template_options).generate(payload), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def _write_bundled(writer, index, key, name, future):
+    data, error = future.result()
+    if error is None:
+        writer.add(index, key, name, data)
+    else:
+        writer.failed(index, key)
+    return RenderResult(index, name, error)
+
+
+def _iter_bundle(template_class, payloads, bundle, bundle_format, filename_pattern, workers, template_options, select,
+                 threads, key):
+    # Records are written into the archive in input order as they finish, holding at most two PDFs per worker
+    workers = workers or os.cpu_count() or 1
+    executor_class = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    with BundleWriter(bundle, bundle_format) as writer, executor_class(max_workers=workers) as executor:
+        pending = deque()
+        for index, payload in enumerate(payloads):
+            if select is not None and not select(index, payload):
+                continue
+            pending.append((index, record_key(payload, index, key), filename_pattern.format(index=index),
+                            executor.submit(_render_bytes, template_class, payload, template_options)))
+            if len(pending) >= workers * 2:
+                yield _write_bundled(writer, *pending.popleft())
+        while pending:
+            yield _write_bundled(writer, *pending.popleft())
+
+
+def _iter_combined(template_class, payloads, filename, template_options, select):
+    # A single PDF document can only be written by one canvas, so records are appended in order in this process
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    partial = _partial_filename(filename)
+    # The partial file goes however the batch ends, including a consumer that stops early or a failing save
+    try:
+        template = template_class(response_type='file', filename=partial, **template_options)
+        for index, payload in enumerate(payloads):
+            if select is not None and not select(index, payload):
+                continue
+            try:
+                template.add_page(payload)
+            except Exception:
+                # add_page has dropped the pages of the failed record, so it leaves no trace in the document
+                yield RenderResult(index, filename, traceback.format_exc())
+                continue
+            yield RenderResult(index, filename, None)
+        template.save()
+        os.replace(partial, filename)
+    finally:
+        _remove(partial)
+
+
+def iter_render_batch(template_class, payloads, mode=PER_RECORD, output_dir='.', filename_pattern='record-{index:05d}.pdf',
+                      combined_filename='combined.pdf', workers=None, template_options=None, journal=None,
+                      select=None, threads=False, bundle='bundle.zip', bundle_format=None, key=None):
+    # template_options are passed to every template, e.g. compiled=True or page_compression=0. journal is the path
+    # of a Journal, so a rerun after a crash renders only the records that are missing or failed. select(index,
+    # payload) picks the records this run renders, while indexes keep counting every record, e.g. for shards.
+    # threads renders per-record output on a thread pool in this process instead of worker processes. BUNDLE streams
+    # every record into the ZIP or tar archive bundle, a file name in output_dir, '-' for stdout or a binary file
+    # object, with a manifest giving each record's key, the value at the dotted path key or its index.
+    template_options = template_options or {}
+    if mode == PER_RECORD:
+        return _iter_per_record(template_class, payloads, output_dir, filename_pattern, workers, template_options,
+                                journal, select, threads)
+    if mode == COMBINED:
+        if journal is not None:
+            raise ValueError('A combined PDF is written in one piece and cannot be resumed from a journal')
+        if workers is not None and workers > 1:
+            raise ValueError('A combined PDF is drawn by one canvas in this process and cannot use worker processes')
+        return _iter_combined(template_class, payloads, os.path.join(output_dir, combined_filename),
+                              template_options, select)
+    if mode == BUNDLE:
+        if journal is not None:
+            raise ValueError('A bundle is written in one piece and cannot be resumed from a journal')
+        if isinstance(bundle, str) and bundle != '-':
+            bundle = os.path.join(output_dir, bundle)
+        return _iter_bundle(template_class, payloads, bundle, bundle_format, filename_pattern, workers,
+                            template_options, select, threads, key)
+    raise ValueError('Unknown batch mode: {:}'.format(mode))
+
+
+def render_batch(template_class, payloads, **kwargs):
+    return list(iter_render_batch(template_class, payloads, **kwargs))
+
+
+# Press the green button in the gutter to run the script.
+if __name__ == '__main__':
+    from gate_pass import GatePassTemplate
+
+    form_data = {
+        'name': 'Stephen Tipa Augustine',
+        'position': 'DEN',
+        'department': 'PD',
+        'supervisor_name': 'Fred Matovu',
+        'supervisor_signature': 'signature-2.png',
+        'vehicle_licence': 'UG 1234Z',
+        'departure_time': '10:25',
+        'return_time': '13:44',
+        'type': 1,
+        'reasons': ('Am going to pick my certificate from Makerere University',
+                    'I want to make tuition fee payment in the bank'),
+        'feedbacks': ('I got my certificate', 'I completed my payment'),
+        'employee_approval': {
+            'signature': 'signature.png',
+            'date': '02/06/2023'
+        },
+        'feedback_approval': {
+            'signature': 'signature-2.png',
+            'date': '02/06/2023'
+        }
+    }
+    for result in render_batch(GatePassTemplate, [form_data] * 8, output_dir='batch-review'):
+        print(result.filename if result.error is None else result.error)
+    render_batch(GatePassTemplate, [form_data] * 8, mode=COMBINED, output_dir='batch-review')
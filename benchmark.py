@@ -0,0 +1,203 @@
+import argparse
+import importlib.util
+import json
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import reportlab
+
+import previews
+from output_profiles import PROFILES
+
+GATE_PASS = 'gatepass'
+FUEL_FORM = 'fuelform'
+
+DEFAULT_RECORDS = (1, 10, 100, 1000, 10000)
+QUICK_RECORDS = (1, 10, 100)
+DEFAULT_BULLETS = (1, 10, 100, 1000)
+QUICK_BULLETS = (1, 10, 100)
+# Number of records rendered for each point of the bullet sweep
+BULLET_SWEEP_RECORDS = 20
+# Number of records rendered with each output profile
+PROFILE_RECORDS = 20
+# Number of previews rendered at each resolution
+PREVIEW_RECORDS = 20
+DEFAULT_PREVIEW_DPI = (36, 96)
+
+
+def gate_pass_payload(bullets=2):
+    return {
+        'name': 'Stephen Tipa Augustine',
+        'position': 'DEN',
+        'department': 'PD',
+        'supervisor_name': 'Fred Matovu',
+        'supervisor_signature': 'signature-2.png',
+        'vehicle_licence': 'UG 1234Z',
+        'departure_time': '10:25',
+        'return_time': '13:44',
+        'type': 1,
+        'reasons': tuple('Reason {:} for leaving the duty station during working hours'.format(i + 1)
+                         for i in range(bullets)),
+        'feedbacks': tuple('Feedback {:} to the responsible supervising officer'.format(i + 1)
+                           for i in range(bullets)),
+        'employee_approval': {'signature': 'signature.png', 'date': '02/06/2023'},
+        'feedback_approval': {'signature': 'signature-2.png', 'date': '02/06/2023'}
+    }
+
+
+def fuel_form_payload():
+    officer = {'name': 'Agness Kabatesi', 'position': 'Senior Administration Officer',
+               'signature': 'signature-2.png', 'date': '02/06/2023'}
+    return {
+        'vehicle': {'vehicle_licence': 'UAY 452L', 'vehicle_model': 'TOYOTA NOAH', 'engine_capacity': '2000 CC',
+                    'fuel_card_no': '00012'},
+        'business': {'date': '05.05.2023', 'purpose': 'Travel to Ndeeba, John Lugendo for engine work',
+                     'distance': '10.5', 'rate': '5,000', 'amount': '52,500',
+                     'amount_in_words': 'Fifty Two Thousand Five Hundred Shillings Only', 'amount_not_taken': ''},
+        'approval': {'prepared': dict(officer), 'checked': dict(officer), 'approved': dict(officer)},
+        'receipt': {'name': 'Agness Kabatesi', 'signature': 'signature-2.png', 'card_number': '012',
+                    'benefactor': 'Stephen Tipa Augustine', 'benefactor_signature': 'signature.png',
+                    'date': '02/06/2023'},
+        'accountability': {'checked': dict(officer), 'verified': dict(officer)}
+    }
+
+
+def template_class(template):
+    if template == GATE_PASS:
+        from gate_pass import GatePassTemplate
+        return GatePassTemplate
+    from fuel_card_form import FuelFormTemplate
+    return FuelFormTemplate
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_case(template, records, bullets, profile=None, dpi=None):
+    # Runs in a fresh worker process so peak RSS belongs to this case alone. With dpi, PNG previews are rendered
+    # instead of PDFs.
+    from instrumentation import instrument
+    from previews import preview
+
+    cls = template_class(template)
+    payload = gate_pass_payload(bullets) if template == GATE_PASS else fuel_form_payload()
+    latencies = []
+    output_bytes = 0
+    started = time.perf_counter()
+    with instrument() as recorder:
+        for _ in range(records):
+            render_started = time.perf_counter()
+            if dpi is None:
+                output_bytes += len(cls(response_type='bytes', profile=profile).generate(payload))
+            else:
+                output_bytes += len(preview(cls, payload, dpi))
+            latencies.append(time.perf_counter() - render_started)
+    elapsed = time.perf_counter() - started
+    return {
+        'records': records,
+        'bullets': bullets,
+        'records_per_sec': records / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'save_ms': recorder.summary()['phases'].get('save', 0.0) / records * 1000,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'output_bytes': output_bytes,
+    }
+
+
+def cases(templates, record_counts, bullet_counts, profiles, preview_dpis):
+    for template in templates:
+        for records in record_counts:
+            yield '{:}-records-{:}'.format(template, records), template, records, 2, None, None
+        if template == GATE_PASS:
+            for bullets in bullet_counts:
+                yield ('{:}-bullets-{:}'.format(template, bullets), template, BULLET_SWEEP_RECORDS, bullets, None,
+                       None)
+        for profile in profiles:
+            yield '{:}-profile-{:}'.format(template, profile), template, PROFILE_RECORDS, 2, profile, None
+        for dpi in preview_dpis:
+            yield '{:}-preview-{:g}dpi'.format(template, dpi), template, PREVIEW_RECORDS, 2, None, dpi
+
+
+def run(templates, record_counts, bullet_counts, profiles=(), preview_dpis=(), report=print):
+    results = {}
+    for name, template, records, bullets, profile, dpi in cases(templates, record_counts, bullet_counts, profiles,
+                                                                preview_dpis):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_case, template, records, bullets, profile, dpi).result()
+        results[name] = result
+        report('{:<28} {:>9.1f} rec/s  p50 {:>8.2f} ms  p99 {:>8.2f} ms  save {:>7.2f} ms  rss {:>8} KB  '
+               '{:>12} bytes'.format(name, result['records_per_sec'], result['p50_ms'], result['p99_ms'],
+                                     result['save_ms'], result['peak_rss_kb'], result['output_bytes']))
+    return {
+        'reportlab': reportlab.Version,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(baseline, current, tolerance):
+    regressions = []
+    for name, result in current['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        if result['records_per_sec'] < previous['records_per_sec'] * (1 - tolerance):
+            regressions.append('{:}: records/sec {:.1f} -> {:.1f}'.format(
+                name, previous['records_per_sec'], result['records_per_sec']))
+        for metric in ('p99_ms', 'peak_rss_kb', 'output_bytes'):
+            if result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append('{:}: {:} {:} -> {:}'.format(name, metric, round(previous[metric], 2),
+                                                                round(result[metric], 2)))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark gate pass and fuel form rendering.')
+    parser.add_argument('--template', choices=(GATE_PASS, FUEL_FORM, 'all'), default='all')
+    parser.add_argument('--records', type=int, nargs='+', help='record counts to render for each template')
+    parser.add_argument('--bullets', type=int, nargs='+', help='reason/feedback bullet counts for the gate pass')
+    parser.add_argument('--profiles', nargs='*', choices=sorted(PROFILES), default=sorted(PROFILES),
+                        help='output profiles to compare for save time and bytes, all by default')
+    parser.add_argument('--preview-dpi', type=float, nargs='*', default=DEFAULT_PREVIEW_DPI,
+                        help='resolutions to time PNG previews at, skipped without rlPyCairo')
+    parser.add_argument('--quick', action='store_true', help='skip the largest record and bullet counts')
+    parser.add_argument('--save', metavar='FILE', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='flag regressions against a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative change before flagging')
+    args = parser.parse_args(argv)
+
+    templates = (GATE_PASS, FUEL_FORM) if args.template == 'all' else (args.template,)
+    record_counts = args.records or (QUICK_RECORDS if args.quick else DEFAULT_RECORDS)
+    bullet_counts = args.bullets or (QUICK_BULLETS if args.quick else DEFAULT_BULLETS)
+    preview_dpis = args.preview_dpi
+    if preview_dpis and importlib.util.find_spec(previews.BACKEND) is None:
+        print('Previews not timed, {:} is not installed'.format(previews.BACKEND))
+        preview_dpis = ()
+    current = run(templates, record_counts, bullet_counts, args.profiles, preview_dpis)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('reportlab') != current['reportlab']:
+            print('Baseline was recorded with reportlab {:}, now running {:}'.format(baseline.get('reportlab'),
+                                                                                   current['reportlab']))
+        regressions = compare(baseline, current, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
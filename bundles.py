@@ -0,0 +1,188 @@
+import hashlib
+import io
+import json
+import os
+import struct
+import sys
+import tarfile
+import tempfile
+import time
+import zlib
+
+# Streams rendered records into a ZIP or tar archive as they finish, so a batch is delivered as one file without
+# writing every PDF to disk first. Memory stays constant whatever the batch size: the ZIP central directory and the
+# manifest are spooled to temporary files until the end, and the tar writer forgets the members it has written.
+
+ZIP = 'zip'
+TAR = 'tar'
+MANIFEST = 'manifest.jsonl'
+CHUNK_SIZE = 1024 * 1024
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_ENTRIES = 0xFFFF
+# Made by Unix, so the external attributes carry file permissions
+ZIP_MADE_BY = 3 << 8 | 45
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+# Names are stored as UTF-8
+ZIP_FLAGS = 0x800
+ZIP_PERMISSIONS = 0o644 << 16
+
+
+def _chunks(f):
+    f.seek(0)
+    return iter(lambda: f.read(CHUNK_SIZE), b'')
+
+
+class ZipArchive:
+    # Stored entries, since PDFs are compressed already. The archive is written front to back, so it can go to a
+    # pipe, and switches to ZIP64 records once it passes 65,535 entries or 4 GB.
+
+    def __init__(self, output):
+        self.output = output
+        self.offset = 0
+        self.entries = 0
+        self.directory = tempfile.TemporaryFile()
+        now = time.localtime()
+        self.dos_time = now.tm_hour << 11 | now.tm_min << 5 | now.tm_sec // 2
+        self.dos_date = (now.tm_year - 1980) << 9 | now.tm_mon << 5 | now.tm_mday
+
+    def write(self, data):
+        self.output.write(data)
+        self.offset += len(data)
+
+    def add(self, name, data):
+        self.add_chunks(name, [data], zlib.crc32(data), len(data))
+
+    def add_file(self, name, f):
+        size = f.tell()
+        crc = 0
+        for chunk in _chunks(f):
+            crc = zlib.crc32(chunk, crc)
+        self.add_chunks(name, _chunks(f), crc, size)
+
+    def add_chunks(self, name, chunks, crc, size):
+        if size >= ZIP64_LIMIT:
+            raise ValueError('{:} is too large for a stored ZIP entry'.format(name))
+        name = name.encode('utf-8')
+        offset = self.offset
+        self.write(struct.pack('<IHHHHHIIIHH', 0x04034b50, ZIP_VERSION, ZIP_FLAGS, 0, self.dos_time, self.dos_date,
+                               crc, size, size, len(name), 0) + name)
+        for chunk in chunks:
+            self.write(chunk)
+        # Entries past 4 GB keep their offset in a ZIP64 extra field
+        extra = struct.pack('<HHQ', 0x0001, 8, offset) if offset >= ZIP64_LIMIT else b''
+        self.directory.write(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, ZIP_MADE_BY,
+                                         ZIP64_VERSION if extra else ZIP_VERSION, ZIP_FLAGS, 0, self.dos_time,
+                                         self.dos_date, crc, size, size, len(name), len(extra), 0, 0, 0,
+                                         ZIP_PERMISSIONS, min(offset, ZIP64_LIMIT)) + name + extra)
+        self.entries += 1
+
+    def close(self):
+        start = self.offset
+        for chunk in _chunks(self.directory):
+            self.write(chunk)
+        self.directory.close()
+        size = self.offset - start
+        if self.entries >= ZIP64_ENTRIES or start >= ZIP64_LIMIT or size >= ZIP64_LIMIT:
+            end = self.offset
+            self.write(struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, ZIP_MADE_BY, ZIP64_VERSION, 0, 0, self.entries,
+                                   self.entries, size, start))
+            self.write(struct.pack('<IIQI', 0x07064b50, 0, end, 1))
+        self.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(self.entries, ZIP64_ENTRIES),
+                               min(self.entries, ZIP64_ENTRIES), min(size, ZIP64_LIMIT), min(start, ZIP64_LIMIT), 0))
+
+
+class TarArchive:
+
+    def __init__(self, output):
+        self.tar = tarfile.open(fileobj=output, mode='w|', format=tarfile.PAX_FORMAT)
+        self.mtime = time.time()
+
+    def add(self, name, data):
+        self.add_stream(name, io.BytesIO(data), len(data))
+
+    def add_file(self, name, f):
+        size = f.tell()
+        f.seek(0)
+        self.add_stream(name, f, size)
+
+    def add_stream(self, name, f, size):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = self.mtime
+        info.mode = 0o644
+        self.tar.addfile(info, f)
+        # TarFile keeps every member for reading back, which an archive only being written never does
+        self.tar.members.clear()
+
+    def close(self):
+        self.tar.close()
+
+
+def bundle_format(destination):
+    # By the extension of the destination, ZIP for pipes and file objects
+    if isinstance(destination, str) and destination.endswith('.tar'):
+        return TAR
+    return ZIP
+
+
+class BundleWriter:
+    # destination is a file name, '-' for stdout or a binary file object such as a pipe or socket file. Files are
+    # written under a temporary name and renamed once the archive is complete. The archive ends with manifest.jsonl,
+    # one line per record with its key, member name, size and SHA-256, or error for records that failed.
+
+    def __init__(self, destination, format=None):
+        format = format or bundle_format(destination)
+        if format not in (ZIP, TAR):
+            raise ValueError('Unknown bundle format: {:}'.format(format))
+        self.filename = None
+        self.partial = None
+        if destination == '-':
+            self.output = sys.stdout.buffer
+        elif isinstance(destination, str):
+            directory = os.path.dirname(destination)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.filename = destination
+            self.partial = '{:}.{:}.part'.format(destination, os.getpid())
+            self.output = open(self.partial, 'wb')
+        else:
+            self.output = destination
+        self.archive = (TarArchive if format == TAR else ZipArchive)(self.output)
+        self.manifest = tempfile.TemporaryFile()
+
+    def record(self, entry):
+        self.manifest.write(json.dumps(entry, default=str).encode('utf-8') + b'\n')
+
+    def add(self, index, key, name, data):
+        self.archive.add(name, data)
+        self.record({'index': index, 'key': key, 'filename': name, 'size': len(data),
+                     'sha256': hashlib.sha256(data).hexdigest()})
+
+    def failed(self, index, key):
+        self.record({'index': index, 'key': key, 'error': True})
+
+    def close(self):
+        self.archive.add_file(MANIFEST, self.manifest)
+        self.manifest.close()
+        self.archive.close()
+        self.output.flush()
+        if self.partial is not None:
+            self.output.close()
+            os.replace(self.partial, self.filename)
+
+    def abort(self):
+        self.manifest.close()
+        if self.partial is not None:
+            self.output.close()
+            os.remove(self.partial)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,245 @@
+import argparse
+import importlib
+import sys
+import time
+
+# Template modules pull in reportlab and PIL, so they are imported only once a command needs them
+TEMPLATES = {'gatepass': ('gate_pass', 'GatePassTemplate'), 'fuelform': ('fuel_card_form', 'FuelFormTemplate')}
+# Seconds between progress lines
+PROGRESS_INTERVAL = 0.5
+
+
+def load_template(name):
+    module_name, class_name = TEMPLATES[name]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class Progress:
+
+    def __init__(self, stream, enabled):
+        self.stream = stream
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.shown = self.started
+        self.records = 0
+        self.failed = 0
+        self.invalid = 0
+        self.skipped = 0
+        self.showing = False
+
+    def rate(self):
+        return self.records / max(time.perf_counter() - self.started, 1e-9)
+
+    def update(self, result):
+        self.records += 1
+        if result.error is not None:
+            self.failed += 1
+        if result.skipped:
+            self.skipped += 1
+        now = time.perf_counter()
+        if self.enabled and now - self.shown >= PROGRESS_INTERVAL:
+            self.shown = now
+            self.showing = True
+            self.stream.write('\r{:} records  {:.1f} rec/s  {:} failed'.format(self.records, self.rate(),
+                                                                               self.failed))
+            self.stream.flush()
+
+    def message(self, text):
+        # Starts on a fresh line when a progress line is showing
+        self.stream.write('{:}{:}\n'.format('\n' if self.showing else '', text))
+        self.showing = False
+
+    def finish(self):
+        if self.showing:
+            self.stream.write('\n')
+
+
+def report(results, progress, import_time):
+    try:
+        for result in results:
+            progress.update(result)
+            if result.error is not None:
+                progress.message('record {:} failed:\n{:}'.format(result.index, result.error.rstrip()))
+    except ValueError as e:
+        progress.finish()
+        sys.stderr.write('{:}\n'.format(e))
+        return 2
+    progress.finish()
+    sys.stderr.write('{:} records, {:} already done, {:} failed, {:} invalid in {:.2f} s ({:.1f} rec/s), '
+                     'imports {:.0f} ms\n'.format(progress.records, progress.skipped, progress.failed, progress.invalid,
+                                                   time.perf_counter() - progress.started, progress.rate(),
+                                                   import_time * 1000))
+    return 1 if progress.failed else 0
+
+
+def invalid_records(args, progress):
+    if not args.skip_invalid:
+        return None
+
+    def invalid(line_number, error):
+        progress.invalid += 1
+        progress.message(str(error))
+    return invalid
+
+
+def render(args):
+    started = time.perf_counter()
+    from batch import BUNDLE, COMBINED, PER_RECORD
+    from ingest import render_records
+
+    template_class = load_template(args.template)
+    import_time = time.perf_counter() - started
+
+    progress = Progress(sys.stderr, args.progress)
+    template_options = {'compiled': args.compiled}
+    if args.no_compression:
+        template_options['page_compression'] = 0
+    if args.profile:
+        template_options['profile'] = args.profile
+    if args.signature_store:
+        template_options['signature_store'] = args.signature_store
+    results = render_records(template_class, args.input, format=args.format,
+                             on_error=invalid_records(args, progress),
+                             mode=BUNDLE if args.bundle else COMBINED if args.combined else PER_RECORD,
+                             output_dir=args.out, filename_pattern=args.pattern, combined_filename=args.combined_name,
+                             workers=args.workers, template_options=template_options, journal=args.journal,
+                             threads=args.threads, bundle=args.bundle, bundle_format=args.bundle_format, key=args.key)
+    return report(results, progress, import_time)
+
+
+def preview(args):
+    started = time.perf_counter()
+    from ingest import iter_payloads
+    from previews import iter_preview_batch
+
+    template_class = load_template(args.template)
+    import_time = time.perf_counter() - started
+
+    progress = Progress(sys.stderr, args.progress)
+    template_options = {'compiled': args.compiled}
+    if args.signature_store:
+        template_options['signature_store'] = args.signature_store
+    payloads = iter_payloads(args.input, template_class.__name__, args.format, invalid_records(args, progress),
+                             read_ahead=True)
+    results = iter_preview_batch(template_class, payloads, dpi=args.dpi, page=args.page, output_dir=args.out,
+                                 filename_pattern=args.pattern, workers=args.workers,
+                                 template_options=template_options, journal=args.journal, threads=args.threads)
+    return report(results, progress, import_time)
+
+
+def shard(args):
+    started = time.perf_counter()
+    from shards import read_manifest, render_shard
+
+    manifest = read_manifest(args.manifest)
+    template_class = load_template(manifest['template'])
+    import_time = time.perf_counter() - started
+
+    progress = Progress(sys.stderr, args.progress)
+    results = render_shard(template_class, manifest, args.shard,
+                           on_error=invalid_records(args, progress), workers=args.workers)
+    return report(results, progress, import_time)
+
+
+def add_signatures(args):
+    import csv
+    from signatures import open_store
+
+    # Columns id, name and path, one signature per row
+    with open(args.input, newline='', encoding='utf-8') as f:
+        rows = [(row['id'], row['path'], row.get('name') or None) for row in csv.DictReader(f)]
+    started = time.perf_counter()
+    added = open_store(args.store).extend(rows)
+    sys.stderr.write('{:} signatures added to {:} in {:.2f} s\n'.format(added, args.store,
+                                                                       time.perf_counter() - started))
+    return 0
+
+
+def merge(args):
+    from shards import merge, read_manifest
+
+    try:
+        records = merge(read_manifest(args.manifest), args.collect)
+    except ValueError as e:
+        sys.stderr.write('{:}\n'.format(e))
+        return 1
+    sys.stderr.write('{:} records merged\n'.format(records))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='report-lab', description='Render gate passes and fuel forms.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('render', help='render a file of records to PDF')
+    command.add_argument('template', choices=sorted(TEMPLATES))
+    command.add_argument('--input', required=True, help='CSV or JSONL file with one record per row or line')
+    command.add_argument('--format', choices=('csv', 'jsonl'), help='input format, by default from the extension')
+    command.add_argument('--out', default='.', help='output directory')
+    command.add_argument('--workers', type=int, help='worker processes for per-record output, all CPUs by default')
+    command.add_argument('--threads', action='store_true', help='render per-record output on threads of one process')
+    output = command.add_mutually_exclusive_group()
+    output.add_argument('--combined', action='store_true', help='write all records into one PDF')
+    output.add_argument('--bundle', help='stream every PDF into this ZIP or tar archive in --out, - for stdout')
+    command.add_argument('--combined-name', default='combined.pdf', help='file name of the combined PDF')
+    command.add_argument('--bundle-format', choices=('zip', 'tar'), help='bundle format, by default from the extension')
+    command.add_argument('--key', help='field naming records in the bundle manifest, e.g. vehicle.fuel_card_no')
+    command.add_argument('--pattern', default='record-{index:05d}.pdf', help='file name pattern per record')
+    command.add_argument('--compiled', action='store_true', help='draw the constant parts of the form once')
+    command.add_argument('--no-compression', action='store_true', help='write uncompressed page streams')
+    command.add_argument('--profile', choices=('default', 'fast', 'compact', 'archive', 'small'),
+                         help='output profile trading save time for file size, see output_profiles.py')
+    command.add_argument('--signature-store', help='directory of packed signatures, looked up by employee ID or name')
+    command.add_argument('--journal', help='journal file; a rerun with the same journal skips finished records')
+    command.add_argument('--skip-invalid', action='store_true', help='report invalid records and carry on')
+    command.add_argument('--progress', action='store_true', help='show records and throughput while rendering')
+    command.set_defaults(run=render)
+
+    command = commands.add_parser('preview', help='render a file of records to PNG previews')
+    command.add_argument('template', choices=sorted(TEMPLATES))
+    command.add_argument('--input', required=True, help='CSV or JSONL file with one record per row or line')
+    command.add_argument('--format', choices=('csv', 'jsonl'), help='input format, by default from the extension')
+    command.add_argument('--out', default='.', help='output directory')
+    command.add_argument('--dpi', type=float, default=96, help='resolution of the previews')
+    command.add_argument('--page', type=int, default=1, help='page to preview, from 1')
+    command.add_argument('--workers', type=int, help='worker processes, all CPUs by default')
+    command.add_argument('--threads', action='store_true', help='render on threads of one process')
+    command.add_argument('--pattern', default='preview-{index:05d}.png', help='file name pattern per record')
+    command.add_argument('--compiled', action='store_true', help='draw the constant parts of the form once')
+    command.add_argument('--signature-store', help='directory of packed signatures, looked up by employee ID or name')
+    command.add_argument('--journal', help='journal file; a rerun with the same journal skips finished records')
+    command.add_argument('--skip-invalid', action='store_true', help='report invalid records and carry on')
+    command.add_argument('--progress', action='store_true', help='show records and throughput while rendering')
+    command.set_defaults(run=preview)
+
+    command = commands.add_parser('shard', help='render one shard of a job manifest')
+    command.add_argument('manifest', help='JSON job manifest shared by every shard')
+    command.add_argument('--shard', type=int, required=True, help='shard to render, from 0 to shards - 1')
+    command.add_argument('--workers', type=int, help='worker processes, all CPUs by default')
+    command.add_argument('--skip-invalid', action='store_true', help='report invalid records and carry on')
+    command.add_argument('--progress', action='store_true', help='show records and throughput while rendering')
+    command.set_defaults(run=shard)
+
+    command = commands.add_parser('merge', help='combine the shard indexes of a finished job')
+    command.add_argument('manifest', help='JSON job manifest shared by every shard')
+    command.add_argument('--collect', help='also copy every PDF into this directory next to the merged index')
+    command.set_defaults(run=merge)
+
+    command = commands.add_parser('signatures', help='pack signature images into a signature store')
+    command.add_argument('store', help='store directory, created when missing')
+    command.add_argument('--input', required=True, help='CSV with id, name and path columns, appended to the store')
+    command.set_defaults(run=add_signatures)
+
+    args = parser.parse_args(argv)
+    # Combined PDFs and bundles are written in one piece, so there is nothing for a journal to resume
+    if args.run is render and args.journal and (args.combined or args.bundle):
+        commands.choices['render'].error('--journal cannot be used with {:}'.format(
+            '--combined' if args.combined else '--bundle'))
+    # A combined PDF is drawn by one canvas in this process
+    if args.run is render and args.combined and args.workers is not None and args.workers > 1:
+        commands.choices['render'].error('--workers cannot be used with --combined')
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
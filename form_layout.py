@@ -0,0 +1,366 @@
+import os
+
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfdoc import PDFDictionary
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Frame
+
+from assets import AssetImage
+from instrumentation import count, phase, recording, render_scope
+from output_profiles import output_profile
+from pagination import flow, overflows
+from paragraph_cache import cached_paragraph
+from signatures import get_signature
+from static_layer import draw_static, static_flowables
+from table_styles import compiled_table
+
+# Forms declare their frames, tables and sections instead of laying them out by hand. A declaration is compiled once
+# per form class and page size into a RenderPlan, which decides what goes into the page background of compiled
+# renders and what is laid out for every record, so each form runs on the same render loop.
+#
+# Plans, styles, compiled tables, parsed paragraphs, assets and static layers are shared by every render in the
+# process and are never changed once built. A template instance holds the state of one document, its canvas, frames
+# and the flowables being laid out, so threads may render at once as long as each draws with an instance of its own.
+
+# Read only, styles needing other values are derived from these
+STYLE_SHEET = getSampleStyleSheet()
+
+
+class FrameSpec:
+    # x, y, width and height are (fraction, points) pairs, the fraction taken of the page size less its margins.
+    # The flowing frame continues on further pages when its content overflows.
+
+    def __init__(self, name, x, y, width, height, boundary=False, flows=False):
+        self.name = name
+        self.box = (x, y, width, height)
+        self.boundary = boundary
+        self.flows = flows
+
+    def geometry(self, inner_width, inner_height):
+        (x, x_points), (y, y_points), (width, width_points), (height, height_points) = self.box
+        return (x * inner_width + x_points, y * inner_height + y_points, width * inner_width + width_points,
+                height * inner_height + height_points)
+
+
+class Field:
+    # A table cell filled from the section's entry of the record, passed through the template method named by build
+    # when there is one, e.g. to draw a signature
+
+    def __init__(self, key, build=None, *args):
+        self.key = key
+        self.build = build
+        self.args = args
+
+    def cell(self, template, values):
+        if values is None:
+            return ''
+        if self.build is None:
+            return values[self.key]
+        return getattr(template, self.build)(values[self.key], *self.args)
+
+
+class Label:
+    # A static cell laid out by a template method, e.g. a title paragraph. Every table gets its own flowables, as
+    # drawing sets their canvas.
+
+    def __init__(self, build, *args):
+        self.build = build
+        self.args = args
+
+    def cell(self, template):
+        return getattr(template, self.build)(*self.args)
+
+
+class TableSpec:
+    # A table of static cells and Field cells. Compiled renders draw the static cells and the lines once in the page
+    # background, then lay out a table of the same geometry holding only the fields for every record. Tables whose
+    # fields are not all as tall as one line of text fix their row heights, so the background lines up with any
+    # record.
+
+    def __init__(self, name, rows, style, lines=(), ratios=None, heights=None):
+        self.name = name
+        self.rows = rows
+        self.style = list(style)
+        self.lines = list(lines)
+        self.ratios = ratios
+        self.heights = heights
+
+    def cells(self, template, values=None, static=True):
+        def cell(spec):
+            if isinstance(spec, Field):
+                return spec.cell(template, values)
+            if not static:
+                return ''
+            return spec.cell(template) if isinstance(spec, Label) else spec
+
+        return [[cell(spec) for spec in row] for row in self.rows]
+
+    def table(self, template, values, width):
+        return compiled_table(self.name, self.cells(template, values), self.style + self.lines, width, self.ratios,
+                              self.heights)
+
+    def static_table(self, template, width):
+        return compiled_table(self.name, self.cells(template), self.style + self.lines, width, self.ratios,
+                              self.heights)
+
+    def dynamic_table(self, template, values, width):
+        return compiled_table(self.name + 'Values', self.cells(template, values, static=False), self.style, width,
+                              self.ratios, self.heights)
+
+
+class Section:
+    # One part of a form, laid out by the template method of the same name from the record's entry at key, or from
+    # the whole record when key is None. A section without a frame draws directly on the canvas. Static sections
+    # ignore the record, and a table section is laid out from its TableSpec instead of a method. form names the
+    # form XObjects of a static section that follows record content in its frame.
+
+    def __init__(self, name, frame=None, key=None, static=False, table=None, form=None):
+        self.name = name
+        self.frame = frame
+        self.key = key
+        self.static = static
+        self.table = table
+        self.form = form
+
+
+def _payload(section, data):
+    return data if section.key is None else data[section.key]
+
+
+def _build(section, compiled, background):
+    # The function laying out a section for one record. background tells whether the static parts of the section
+    # are already in the page background of a compiled render.
+    if section.table is not None:
+        table = section.table
+        if compiled and background:
+            return lambda template, data: [table.dynamic_table(template, _payload(section, data),
+                                                               template.frames[section.frame].width)]
+        return lambda template, data: [table.table(template, _payload(section, data),
+                                                   template.frames[section.frame].width)]
+    if section.static and compiled and section.form is not None:
+        def build(template, data):
+            frame = template.frames[section.frame]
+            return static_flowables(section.form, getattr(template, section.name), frame._getAvailableWidth(),
+                                    frame._aH)
+        return build
+    if section.static:
+        return lambda template, data: getattr(template, section.name)()
+    return lambda template, data: getattr(template, section.name)(_payload(section, data))
+
+
+class RenderPlan:
+
+    def __init__(self, form_class, pagesize):
+        page_width, page_height = pagesize
+        horizontal_margin, vertical_margin = form_class.margins
+        inner = (page_width - 2 * horizontal_margin, page_height - 2 * vertical_margin)
+        self.frames = tuple((spec, spec.geometry(*inner)) for spec in form_class.frame_specs)
+        self.continuation = (form_class.continuation_spec, form_class.continuation_spec.geometry(*inner))
+        self.canvas_sections = tuple(section for section in form_class.sections if section.frame is None)
+        # Static sections drawn on the canvas or first in their frame go into the background of compiled renders.
+        # Later static sections sit wherever the record content before them ends, so they are recorded as form
+        # flowables instead when they name a form.
+        background = []
+        filled = set()
+        for section in form_class.sections:
+            if section.frame is None or ((section.static or section.table is not None)
+                                         and section.frame not in filled):
+                background.append(section)
+            filled.add(section.frame)
+        self.background = tuple(background)
+        sections = [section for section in form_class.sections if section.frame is not None]
+        # Steps laying out one record, (phase name, frame name, build function), for regular and compiled renders
+        self.steps = {False: tuple((section.name, section.frame, _build(section, False, False))
+                                   for section in sections),
+                      True: tuple((section.name, section.frame, _build(section, True, section in background))
+                                  for section in sections if not (section.static and section in background))}
+
+
+_plans = {}
+
+
+def render_plan(form_class, pagesize):
+    key = (form_class, tuple(pagesize))
+    plan = _plans.get(key)
+    if plan is None:
+        # Threads building the same plan at once all end up with the first one stored
+        plan = _plans.setdefault(key, RenderPlan(form_class, pagesize))
+    return plan
+
+
+class FormTemplate:
+    # Subclasses declare pagesize, version, margins, frame_specs, continuation_spec, sections and the name of their
+    # compiled background, and provide a method for every section
+    margins = (32, 32)
+    frame_specs = ()
+    continuation_spec = None
+    sections = ()
+    background = None
+
+    def __init__(self, response_type='file', filename='print-review.pdf', pdf_canvas=None, stream=None,
+                 compiled=False, invariant=None, page_compression=None, signature_store=None, profile=None):
+        # invariant fixes the document ID and timestamps, so identical records render to identical bytes.
+        # It and page_compression follow reportlab's rl_config when left as None. With a signature_store directory,
+        # signature fields may also name an employee ID or name packed into that store. profile names an output
+        # profile, which sets the stream encoding in place of page_compression.
+        if pdf_canvas is not None:
+            # Draw onto a canvas owned by the caller, e.g. a combined batch document
+            self.canvas = pdf_canvas
+        elif response_type == 'file':
+            self.canvas = canvas.Canvas(filename, pagesize=self.pagesize, invariant=invariant,
+                                        pageCompression=page_compression)
+        else:
+            # The PDF is produced in memory by save(), which returns it or writes it to the caller's stream
+            self.canvas = canvas.Canvas(None, pagesize=self.pagesize, invariant=invariant,
+                                        pageCompression=page_compression)
+        self.page_width, self.page_height = self.canvas._pagesize
+        self.plan = render_plan(type(self), self.canvas._pagesize)
+        # Draw the static sections and frame borders from a form XObject recorded once per document, leaving only
+        # the per-record fields to be laid out on every render
+        self.compiled = compiled
+        self.frames = {spec.name: Frame(*geometry, showBoundary=int(spec.boundary and not compiled))
+                       for spec, geometry in self.plan.frames}
+        spec, geometry = self.plan.continuation
+        self.continuation_frame = Frame(*geometry, showBoundary=int(spec.boundary))
+        self.styleSheet = STYLE_SHEET
+        self.content = {name: [] for name in self.frames}
+        # Payload whose flowables are in content, see prepare()
+        self.prepared = None
+        self.signature_store = signature_store
+        self.profile = output_profile(profile)
+        self.response_type = response_type
+        self.stream = stream
+
+    def title_paragraph(self, title):
+        return cached_paragraph('''
+                   <para align=left fontSize=9 spaceb=3><b>{:}<font color=black></font></b></para>'''.format(title),
+                                self.styleSheet["BodyText"])
+
+    def content_paragraph(self, text):
+        return cached_paragraph('''
+                   <para align=left fontSize=9 spaceb=3>{:}</para>'''.format(text),
+                                self.styleSheet["BodyText"])
+
+    def signature_label(self, text):
+        return cached_paragraph('''
+                   <para align=center fontSize=10 spaceBefore=0>{:}</para>'''.format(text),
+                                self.styleSheet["BodyText"])
+
+    def signature(self, url):
+        return get_signature(url, self.signature_store)
+
+    def draw_signature(self, url):
+        return AssetImage(self.signature(url), .5 * inch)
+
+    def draw_background(self):
+        for spec, geometry in self.plan.frames:
+            if spec.boundary:
+                self.frames[spec.name].drawBoundary(self.canvas, 1)
+        for section in self.plan.background:
+            if section.frame is None:
+                getattr(self, section.name)()
+                continue
+            frame = self.frames[section.frame]
+            if section.table is not None:
+                frame.addFromList([section.table.static_table(self, frame.width)], self.canvas)
+            else:
+                frame.addFromList(getattr(self, section.name)(), self.canvas)
+        for frame in self.frames.values():
+            frame._reset()
+
+    def prepare(self, data):
+        # Builds the record's flowables once, so a fit check and the render that follows share their measurements
+        if self.prepared is data:
+            return
+        self.content = {name: [] for name in self.frames}
+        for name, frame, build in self.plan.steps[self.compiled]:
+            with phase(name):
+                self.content[frame] += build(self, data)
+        self.prepared = data
+
+    def fits(self, data):
+        # Whether the record fits on a single page, measured without drawing anything
+        self.prepare(data)
+        with phase('fits'):
+            return not any(overflows(self.frames[name], content) for name, content in self.content.items())
+
+    def render(self, data):
+        if self.compiled:
+            with phase('draw_background'):
+                draw_static(self.canvas, self.background, self.draw_background)
+        else:
+            for section in self.plan.canvas_sections:
+                with phase(section.name):
+                    getattr(self, section.name)()
+        self.prepare(data)
+
+        with phase('addFromList'):
+            for spec, geometry in self.plan.frames:
+                if spec.flows:
+                    flow(self.frames[spec.name], self.content[spec.name], self.canvas, self.continuation_frame)
+                else:
+                    self.frames[spec.name].addFromList(self.content[spec.name], self.canvas)
+        self.prepared = None
+
+    def reset(self):
+        # Prepare the frames for the next page without rebuilding them or the stylesheet
+        for frame in self.frames.values():
+            frame._reset()
+        self.continuation_frame._reset()
+        self.content = {name: [] for name in self.frames}
+        self.prepared = None
+
+    def add_page(self, data):
+        # A record that fails part way through is taken out of the document again, along with any pages it had
+        # already finished by overflowing, so a combined document can carry on with the next record
+        pages = len(self.canvas._doc.Pages.pages), self.canvas.getPageNumber()
+        try:
+            with render_scope():
+                self.render(data)
+                with phase('showPage'):
+                    self.canvas.showPage()
+        except Exception:
+            self.discard_pages(*pages)
+            raise
+        finally:
+            self.reset()
+
+    def discard_pages(self, pages, page_number):
+        document = self.canvas._doc
+        for page in document.Pages.pages[pages:]:
+            # Object numbers have to stay contiguous, so the pages are replaced by empty objects rather than removed
+            document.idToObject[page.__InternalName__] = PDFDictionary()
+        del document.Pages.pages[pages:]
+        self.canvas._pageNumber = page_number - 1
+        self.canvas._startPage()
+
+    def save(self):
+        with phase('save'):
+            if self.profile is not None:
+                self.profile.apply(self.canvas._doc)
+            if self.response_type == 'file':
+                self.canvas.save()
+                if recording() and isinstance(self.canvas._filename, str):
+                    count('bytes_written', os.path.getsize(self.canvas._filename))
+                return None
+            data = self.canvas.getpdfdata()
+            count('bytes_written', len(data))
+            if self.stream is None:
+                return data
+            # Sockets only provide sendall(), files and HTTP responses provide write()
+            write = getattr(self.stream, 'write', None) or self.stream.sendall
+            write(data)
+            return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.save()
+
+    def generate(self, data):
+        with render_scope():
+            self.render(data)
+            return self.save()
@@ -1,70 +1,127 @@
-import io
-
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import landscape, A4
-from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.units import inch
-from reportlab.pdfgen import canvas
-from reportlab.platypus import Table, Paragraph, Frame, ListFlowable, Image, TableStyle, Spacer
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import ListFlowable, Spacer
+from reportlab.platypus.paragraph import imgVRange
+
+from assets import AssetImage, bind_paragraph_images, get_asset
+from form_layout import Field, FormTemplate, FrameSpec, Section, TableSpec
+from paragraph_cache import build_paragraph, cached_paragraph
+from streaming_table import StreamingTable
+from table_styles import compiled_table
 
 VERTICAL_MARGIN = 32
 HORIZONTAL_MARGIN = 32
 
+VEHICLE_TABLE_STYLE = [('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                       ('SPAN', (0, 0), (-1, 1)),
+                       ('ALIGN', (0, 0), (-1, 1), 'CENTER'),
+                       ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
+                       ('TOPPADDING', (0, 0), (-1, -1), 5),
+                       ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+                       ]
+VEHICLE_TABLE_LINES = [('BOX', (0, 0), (-1, -1), 0.25, colors.black),
+                       ('GRID', (0, 0), (-1, -1), 1, colors.black)]
+APPROVAL_TABLE_STYLE = [('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                        ('BOX', (0, 0), (-1, -1), 1, colors.black),
+                        ('LINEAFTER', (0, 0), (1, -1), 1, colors.black),
+                        ('LINEAFTER', (2, 0), (1, -1), 1, colors.black),
+                        ('ALIGN', (0, 0), (-1, 1), 'CENTER'),
+                        ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
+                        ('TOPPADDING', (0, 0), (-1, -1), 3),
+                        ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+                        ('BOTTOMPADDING', (0, 2), (-1, 2), 12),
+                        ]
+ACCOUNTABILITY_TABLE_STYLE = [('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                              ('BOX', (0, 0), (-1, -1), 1, colors.black),
+                              ('ALIGN', (0, 0), (-1, 1), 'CENTER'),
+                              ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
+                              ('LINEAFTER', (0, 0), (1, -1), 1, colors.black),
+                              ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                              ]
+AGREEMENT_TABLE_STYLE = [('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                         ('BOX', (0, 0), (-1, -1), 1, colors.black),
+                         ('TOPPADDING', (0, 0), (-1, -1), 3),
+                         ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+                         ]
+# Business column widths as multiples of an equal sixth of the frame width
+BUSINESS_COLUMN_RATIOS = [0.2, 0.9, 3, 0.7, 0.6, 0.6]
+# Transparent image holding the place of a signature that has not arrived yet, see stamping.py. It also stands in
+# as the file read by the paragraph parser for every inline signature, see inline_signature().
+PENDING_SIGNATURE = 'pending-signature.png'
+# Canvas callback named by the <onDraw> tags that record where signatures and dates are drawn
+LAYOUT_CALLBACK = 'layoutSlot'
 
-class FuelFormTemplate:
 
-    def __init__(self, response_type='file', filename='print-review.pdf'):
-        if response_type == 'file':
-            self.canvas = canvas.Canvas(filename, pagesize=landscape(A4))
-        else:
-            buffer = io.BytesIO()
-            self.canvas = canvas.Canvas(buffer, pagesize=landscape(A4))
-        self.page_width, self.page_height = self.canvas._pagesize
-        self.logo_frame = Frame(HORIZONTAL_MARGIN, (self.page_height - 2 * VERTICAL_MARGIN) * 0.83,
-                                (self.page_width - 2 * HORIZONTAL_MARGIN) / 2,
-                                (self.page_height - 2 * VERTICAL_MARGIN) * 0.2, showBoundary=1)
-        self.vehicle_frame = Frame(HORIZONTAL_MARGIN + (self.page_width - 2 * HORIZONTAL_MARGIN) / 2,
-                                   (self.page_height - 2 * VERTICAL_MARGIN) * 0.83,
-                                   (self.page_width - 2 * HORIZONTAL_MARGIN) / 2,
-                                   (self.page_height - 2 * VERTICAL_MARGIN) * 0.2, showBoundary=1)
-        self.body_frame = Frame(HORIZONTAL_MARGIN, VERTICAL_MARGIN, self.page_width - 2 * HORIZONTAL_MARGIN,
-                                (self.page_height - 2 * VERTICAL_MARGIN) * 0.76, showBoundary=1)
-        self.styleSheet = getSampleStyleSheet()
-        self.logo_frame_content = []
-        self.vehicle_frame_content = []
-        self.body_frame_content = []
-        self.response_type = response_type
+VEHICLE_TABLE = TableSpec('FuelVehicle', [['FUEL CARD MANAGEMENT FORM', ''],
+                                           ['VEHICLE REG NO.', Field('vehicle_licence')],
+                                           ['MAKE/MODEL', Field('vehicle_model')],
+                                           ['ENGINE CAPACITY (CC)', Field('engine_capacity')],
+                                           ['FUEL CARD NO.', Field('fuel_card_no')]],
+                          VEHICLE_TABLE_STYLE, VEHICLE_TABLE_LINES)
+
+
+def business_table_style(trips, totals=True):
+    # Row indices depend on how many trip rows the table, or the page of a long trip table, holds
+    style = [('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+             ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
+             ('GRID', (0, 0), (-1, -1), 1, colors.black),
+             ('ALIGN', (0, 0), (-1, 0), 'CENTER')]
+    if trips:
+        style.append(('ALIGN', (4, 1), (4, trips), 'RIGHT'))
+    style += [('ALIGN', (5, 1), (-1, -1), 'RIGHT'),
+              ('TOPPADDING', (0, 0), (-1, -1), 2),
+              ('BOTTOMPADDING', (0, 0), (-1, -1), 2)]
+    if totals:
+        style += [('SPAN', (0, trips + 2), (1, trips + 2)),
+                  ('SPAN', (0, trips + 1), (4, trips + 1)),
+                  ('SPAN', (3, trips + 2), (4, trips + 2))]
+    return style
+
+
+def parse_amount(amount):
+    if isinstance(amount, str):
+        amount = amount.replace(',', '').strip() or '0'
+        return float(amount) if '.' in amount else int(amount)
+    return amount
+
+
+def format_amount(amount):
+    if isinstance(amount, float):
+        return '{:,.2f}'.format(amount)
+    return '{:,}'.format(amount)
+
+
+class FuelFormTemplate(FormTemplate):
+    pagesize = landscape(A4)
+    # Part of render cache keys, bump it when the layout changes so earlier renders are not served
+    version = 2
+    margins = (HORIZONTAL_MARGIN, VERTICAL_MARGIN)
+    frame_specs = (FrameSpec('logo', (0, HORIZONTAL_MARGIN), (0.83, 0), (0.5, 0), (0.2, 0), boundary=True),
+                   FrameSpec('vehicle', (0.5, HORIZONTAL_MARGIN), (0.83, 0), (0.5, 0), (0.2, 0), boundary=True),
+                   FrameSpec('body', (0, HORIZONTAL_MARGIN), (0, VERTICAL_MARGIN), (1, 0), (0.76, 0), boundary=True,
+                             flows=True))
+    # Body content that overflows, such as a long trip table, continues on pages holding only this frame
+    continuation_spec = FrameSpec('continuation', (0, HORIZONTAL_MARGIN), (0, VERTICAL_MARGIN), (1, 0), (1, 0),
+                                  boundary=True)
+    sections = (Section('draw_logo', frame='logo', static=True),
+                Section('draw_vehicle_info', frame='vehicle', key='vehicle', table=VEHICLE_TABLE),
+                Section('draw_business_info', frame='body', key='business'),
+                Section('draw_approval_info', frame='body', key='approval'),
+                Section('draw_agreement_info', frame='body', static=True, form='FuelAgreement'),
+                Section('receipt_acknowledgement', frame='body', key='receipt'),
+                Section('draw_accountability_info', frame='body', key='accountability'))
+    background = 'FuelFormBackground'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Page and position of every approval and accountability signature and date drawn by the last render
+        self.layout = {}
+        self.canvas.setNamedCB(LAYOUT_CALLBACK, self.record_slot)
 
     def draw_logo(self):
-        image = Image('kmc-doc-logo.jpg')
-        image.drawHeight = 4.25 * inch * image.drawHeight / image.drawWidth
-        image.drawWidth = 4.25 * inch
-        self.logo_frame_content.append(image)
-
-    def draw_vehicle_info(self, info):
-        data = [['FUEL CARD MANAGEMENT FORM', ''],
-                ['VEHICLE REG NO.', info['vehicle_licence']],
-                ['MAKE/MODEL', info['vehicle_model']],
-                ['ENGINE CAPACITY (CC)', info['engine_capacity']],
-                ['FUEL CARD NO.', info['fuel_card_no']]]
-        t = Table(data)
-        t.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                               ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
-                               ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                               ('SPAN', (0, 0), (-1, 1)),
-                               ('ALIGN', (0, 0), (-1, 1), 'CENTER'),
-                               ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-                               ('TOPPADDING', (0, 0), (-1, -1), 5),
-                               ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-                               ]))
-        # Calculate the width of each column
-        num_columns = 2  # Assuming all rows have the same number of columns
-        column_width = self.vehicle_frame.width / num_columns
-        # Create a list of equal widths for all columns
-        column_widths = [column_width] * num_columns
-        # Set the column widths for the table
-        t._argW = column_widths
-        self.vehicle_frame_content.append(t)
+        return [AssetImage(get_asset('kmc-doc-logo.jpg'), 4.25 * inch)]
 
     def draw_approval_info(self, info):
         data = [[self.underlined_paragraph('<b>Prepared By</b>'), self.underlined_paragraph('<b>Checked By</b>'),
@@ -75,53 +132,20 @@ class FuelFormTemplate:
                 [self.content_paragraph(f"<b>Position:</b> {info['prepared']['position']}"),
                  self.content_paragraph(f"<b>Position:</b> {info['prepared']['position']}"),
                  self.content_paragraph(f"<b>Position:</b> {info['prepared']['position']}")],
-                [self.signature_date({'signature': info['prepared']['signature'], 'date': info['prepared']['date']}),
-                 self.signature_date({'signature': info['checked']['signature'], 'date': info['prepared']['date']}),
-                 self.signature_date({'signature': info['approved']['signature'], 'date': info['prepared']['date']})]]
-        t = Table(data)
-        t.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                               ('BOX', (0, 0), (-1, -1), 1, colors.black),
-                               ('LINEAFTER', (0, 0), (1, -1), 1, colors.black),
-                               ('LINEAFTER', (2, 0), (1, -1), 1, colors.black),
-                               ('ALIGN', (0, 0), (-1, 1), 'CENTER'),
-                               ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-                               ('TOPPADDING', (0, 0), (-1, -1), 3),
-                               ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-                               ('BOTTOMPADDING', (0, 2), (-1, 2), 12),
-                               ]))
-        # Calculate the width of each column
-        num_columns = 3  # Assuming all rows have the same number of columns
-        column_width = self.body_frame.width / num_columns
-        # Create a list of equal widths for all columns
-        column_widths = [column_width] * num_columns
-        # Set the column widths for the table
-        t._argW = column_widths
-        self.body_frame_content.append(t)
+                [self.signature_date(info['prepared'], 'approval.prepared'),
+                 self.signature_date(info['checked'], 'approval.checked'),
+                 self.signature_date(info['approved'], 'approval.approved')]]
+        return [compiled_table('FuelApproval', data, APPROVAL_TABLE_STYLE, self.frames['body'].width)]
 
     def draw_accountability_info(self, info):
         data = [[self.underlined_paragraph('Accountability Checked By'),
                  self.underlined_paragraph('Accountability Verified By')],
-                [self.accountability_signature(info['checked']), self.accountability_signature(info['verified'])]]
-        t = Table(data)
-        t.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                               ('BOX', (0, 0), (-1, -1), 1, colors.black),
-                               ('ALIGN', (0, 0), (-1, 1), 'CENTER'),
-                               ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-                               ('LINEAFTER', (0, 0), (1, -1), 1, colors.black),
-                               ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                               ]))
-        # Calculate the width of each column
-        num_columns = 2  # Assuming all rows have the same number of columns
-        column_width = self.body_frame.width / num_columns
-        # Create a list of equal widths for all columns
-        column_widths = [column_width] * num_columns
-        # Set the column widths for the table
-        t._argW = column_widths
-        self.body_frame_content.append(t)
+                [self.accountability_signature(info['checked'], 'accountability.checked'),
+                 self.accountability_signature(info['verified'], 'accountability.verified')]]
+        return [compiled_table('FuelAccountability', data, ACCOUNTABILITY_TABLE_STYLE, self.frames['body'].width)]
 
     def draw_agreement_info(self):
-        self.body_frame_content.append(self.underlined_paragraph('Fuel Card User Agreement'))
-        self.body_frame_content.append(Spacer(1, 0.05 * inch))
+        title = self.underlined_paragraph('Fuel Card User Agreement')
         agreement_list = ListFlowable(
             [
                 self.content_paragraph(
@@ -146,138 +170,129 @@ class FuelFormTemplate:
             ],
             bulletType='1'
         )
-        data = [[agreement_list]]
-        t = Table(data)
-        t.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                               ('BOX', (0, 0), (-1, -1), 1, colors.black),
-                               ('TOPPADDING', (0, 0), (-1, -1), 3),
-                               ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-                               ]))
-        # Calculate the width of each column
-        num_columns = 1  # Assuming all rows have the same number of columns
-        column_width = self.body_frame.width / num_columns
-        # Create a list of equal widths for all columns
-        column_widths = [column_width] * num_columns
-        # Set the column widths for the table
-        t._argW = column_widths
-        self.body_frame_content.append(t)
-        self.body_frame_content.append(Spacer(1, 0.1 * inch))
+        t = compiled_table('FuelAgreement', [[agreement_list]], AGREEMENT_TABLE_STYLE, self.frames['body'].width)
+        return [title, Spacer(1, 0.05 * inch), t, Spacer(1, 0.1 * inch)]
 
     def draw_business_info(self, info):
+        if 'trips' in info:
+            t = self.trip_table(info)
+        else:
+            # Single trip forms carry the trip and its total on the business section itself
+            t = self.business_table([self.trip_row(1, info)], info, info['amount'])
+        return [t, Spacer(1, 0.2 * inch)]
+
+    def trip_table(self, info):
+        # Trips are pulled from the iterable as pages are laid out and the total accumulates as they pass
+        total = [0]
+
+        def rows():
+            for number, trip in enumerate(info['trips'], 1):
+                total[0] += parse_amount(trip['amount'])
+                yield self.trip_row(number, trip)
+
+        def build(trips, last):
+            if last:
+                return self.business_table(trips, info, format_amount(total[0]))
+            return self.business_table(trips)
+
+        return StreamingTable(rows(), build)
+
+    def trip_row(self, number, trip):
+        return [str(number), trip['date'], self.content_paragraph(trip['purpose']), trip['distance'], trip['rate'],
+                trip['amount']]
+
+    def business_table(self, trips, info=None, total=None):
         data = [[self.content_paragraph('<b>SN</b>'), self.content_paragraph('<b>DATE</b>'),
                  self.content_paragraph('<b>BUSINESS PURPOSE</b>'), self.title_paragraph('DISTANCE (KM) (ATTACH MAP)'),
                  self.content_paragraph('<b>RATE (UGX)</b>'),
-                 self.content_paragraph('<b>AMOUNT (UGX)</b>')],
-                ['1', info['date'], self.content_paragraph(info['purpose']), info['distance'], info['rate'],
-                 info['amount']], ['Total', info['amount']],
-                [self.content_paragraph('<b>Approved Amount in Words</b>'), '',
-                 info['amount_in_words'], self.content_paragraph('<b>Amount Not Taken</b>'),
-                 '', info['amount_not_taken']]]
-        t = Table(data)
-        t.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                               ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
-                               ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                               ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                               ('ALIGN', (4, 1), (4, 1), 'RIGHT'),
-                               ('ALIGN', (5, 1), (-1, -1), 'RIGHT'),
-                               ('TOPPADDING', (0, 0), (-1, -1), 2),
-                               ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-                               ('SPAN', (0, 3), (1, 3)),
-                               ('SPAN', (0, 2), (4, 2)),
-                               ('SPAN', (3, 3), (4, 3))
-                               ]))
-        # Calculate the width of each column
-        num_columns = 6  # Assuming all rows have the same number of columns
-        column_width = self.body_frame.width / num_columns
-        # Create a list of equal widths for all columns
-        column_widths = [column_width * 0.2, column_width * 0.9, column_width * 3, column_width * 0.7,
-                         column_width * 0.6,
-                         column_width * 0.6]
-        # Set the column widths for the table
-        t._argW = column_widths
-        self.body_frame_content.append(t)
-        self.body_frame_content.append(Spacer(1, 0.2 * inch))
-
-    def title_paragraph(self, title):
-        return Paragraph('''
-                   <para align=left fontSize=9 spaceb=3><b>{:}<font color=black></font></b></para>'''.format(title),
-                         self.styleSheet["BodyText"])
-
-    def content_paragraph(self, text):
-        return Paragraph('''
-                   <para align=left fontSize=9 spaceb=3>{:}</para>'''.format(text),
-                         self.styleSheet["BodyText"])
+                 self.content_paragraph('<b>AMOUNT (UGX)</b>')]] + trips
+        if info is None:
+            # Page of a trip table that continues on the next page
+            return compiled_table('FuelBusinessTrips', data, business_table_style(len(trips), False),
+                                  self.frames['body'].width, BUSINESS_COLUMN_RATIOS)
+        data += [['Total', '', '', '', '', total],
+                 [self.content_paragraph('<b>Approved Amount in Words</b>'), '',
+                  info['amount_in_words'], self.content_paragraph('<b>Amount Not Taken</b>'),
+                  '', info['amount_not_taken']]]
+        return compiled_table('FuelBusiness', data, business_table_style(len(trips)), self.frames['body'].width,
+                              BUSINESS_COLUMN_RATIOS)
 
     def receipt_acknowledgement(self, info):
-        signature = self.make_image_responsive(info['signature'])
-        benefactor_signature = self.make_image_responsive(info['benefactor_signature'])
-        p = Paragraph('''
-                   <para align=left fontSize=9 align="left">I {:} (Signature:   <img src="{:}" width="{:}" height="{:}" 
-                   />  ) acknowledge receipt of KMC Fuel Card No. {:} from {:} (Signature:   <img src="{:}" width="{:}" 
-                   height="{:}" />  ) 
-                   Date: {:}</para>'''.format(info['name'], info['signature'], signature[0], signature[1],
-                                              info['card_number'], info['benefactor'],
-                                              info['benefactor_signature'], benefactor_signature[0],
-                                              benefactor_signature[1], info['date']),
-                      self.styleSheet["BodyText"])
-        self.body_frame_content.append(p)
-        self.body_frame_content.append(Spacer(1, 0.1 * inch))
+        signature, signature_image = self.inline_signature(info['signature'])
+        benefactor_signature, benefactor_image = self.inline_signature(info['benefactor_signature'])
+        p = bind_paragraph_images(build_paragraph('''
+                   <para align=left fontSize=9 align="left">I {:} (Signature:   {:}  ) acknowledge receipt of KMC Fuel 
+                   Card No. {:} from {:} (Signature:   {:}  ) 
+                   Date: {:}</para>'''.format(info['name'], signature, info['card_number'], info['benefactor'],
+                                              benefactor_signature, info['date']),
+                      self.styleSheet["BodyText"]), [signature_image, benefactor_image])
+        return [p, Spacer(1, 0.1 * inch)]
 
     def underlined_paragraph(self, text):
-        return Paragraph('''
+        return cached_paragraph('''
                    <para align=left fontSize=10 align="center"><u>{:}</u></para>'''.format(text),
-                         self.styleSheet["BodyText"])
-
-    def signature_label(self, text):
-        return Paragraph('''
-                   <para align=center fontSize=10 spaceBefore=0>{:}</para>'''.format(text),
-                         self.styleSheet["BodyText"])
-
-    def accountability_signature(self, info):
-        signature = self.make_image_responsive(info['signature'])
-        p = Paragraph('''
-                   <para align=left fontSize=9 align="left"><b>Name:</b> {:}  <b>Signature:</b> <img src="{:}" width="{:}" 
-                   height="{:}" />  <b>Date:</b> {:}</para>'''.format(info['name'], info['signature'], signature[0],
-                                                               signature[1], info['date']),
-                      self.styleSheet["BodyText"])
+                                self.styleSheet["BodyText"])
+
+    def accountability_signature(self, info, slot):
+        signature, image = self.signature_slot(info, slot)
+        p = bind_paragraph_images(build_paragraph('''
+                   <para align=left fontSize=9 align="left"><b>Name:</b> {:}  <b>Signature:</b> {:}  <b>Date:</b>{:}
+                   </para>'''.format(info['name'], signature, self.date_slot(info, slot)),
+                      self.styleSheet["BodyText"]), [image])
         return p
 
-    def signature_date(self, info):
-        signature = self.make_image_responsive(info['signature'])
-        p = Paragraph('''
-                   <para align=left fontSize=9 align="left"><b>Signature:</b> <img src="{:}" width="{:}" 
-                   height="{:}" />  <b>Date:</b> {:}</para>'''.format(info['signature'], signature[0],
-                                                                      signature[1], info['date']),
-                      self.styleSheet["BodyText"])
+    def signature_date(self, info, slot):
+        signature, image = self.signature_slot(info, slot)
+        p = bind_paragraph_images(build_paragraph('''
+                   <para align=left fontSize=9 align="left"><b>Signature:</b> {:}  <b>Date:</b>{:}
+                   </para>'''.format(signature, self.date_slot(info, slot)),
+                      self.styleSheet["BodyText"]), [image])
         return p
 
+    def inline_signature(self, url):
+        # The <img> markup names the small placeholder file for the parser to read, and the signature itself is
+        # bound afterwards, so store entries need no file and large scans are not read again for every paragraph
+        image = self.signature(url)
+        width, height = image.scaled(.5 * inch)
+        return '<img src="{:}" width="{:}" height="{:}" />'.format(PENDING_SIGNATURE, width, height), image
+
+    def signature_slot(self, info, slot):
+        # A signature still to come is drawn transparent, so it can be stamped in later without moving anything
+        signature, image = self.inline_signature(info['signature'] or PENDING_SIGNATURE)
+        width, height = image.scaled(.5 * inch)
+        return '<onDraw name="{:}" label="signature {:} {:} {:}"/>{:}'.format(LAYOUT_CALLBACK, slot, width, height,
+                                                                               signature), image
+
     @staticmethod
-    def draw_signature(url):
-        image = Image(url)
-        image.drawHeight = .5 * inch * image.drawHeight / image.drawWidth
-        image.drawWidth = .5 * inch
-        return image
+    def date_slot(info, slot):
+        # The tag comes before the space, which a missing date would leave trailing and dropped from the line
+        return '<onDraw name="{:}" label="date {:}"/> {:}'.format(LAYOUT_CALLBACK, slot, info['date'] or '')
+
+    def record_slot(self, canv, kind, label):
+        # Runs while a signature paragraph is drawn, at the position of the image or date that follows the tag
+        part, slot, *size = label.split()
+        state = canv._curr_tx_info
+        font_size = state['tx']._fontsize or state['xs'].style.fontSize
+        entry = self.layout.setdefault(slot, {'page': canv.getPageNumber()})
+        if part == 'signature':
+            width, height = map(float, size)
+            x, y = canv.absolutePosition(state['cur_x'], state['cur_y'] + imgVRange(height, 'bottom', font_size)[0])
+            entry['signature'] = [x, y, width, height]
+        else:
+            font_name = state['xs'].style.fontName
+            x = state['cur_x'] + stringWidth(' ', font_name, font_size)
+            entry['date'] = list(canv.absolutePosition(x, state['cur_y']))
+            entry['font'] = [font_name, font_size]
 
     @staticmethod
-    def make_image_responsive(url):
-        image = Image(url)
-        image.drawHeight = .5 * inch * image.drawHeight / image.drawWidth
-        image.drawWidth = .5 * inch
-        return image.drawWidth, image.drawHeight
-
-    def generate(self, data):
-        self.draw_logo()
-        self.draw_vehicle_info(data['vehicle'])
-        self.draw_business_info(data['business'])
-        self.draw_approval_info(data['approval'])
-        self.draw_agreement_info()
-        self.receipt_acknowledgement(data['receipt'])
-        self.draw_accountability_info(data['accountability'])
-
-        self.logo_frame.addFromList(self.logo_frame_content, self.canvas)
-        self.vehicle_frame.addFromList(self.vehicle_frame_content, self.canvas)
-        self.body_frame.addFromList(self.body_frame_content, self.canvas)
-        self.canvas.save()
+    def image_paths(data):
+        officers = list(data['approval'].values()) + list(data['accountability'].values())
+        return (('kmc-doc-logo.jpg', data['receipt']['signature'], data['receipt']['benefactor_signature'])
+                + tuple(officer['signature'] for officer in officers if officer['signature']))
+
+    def render(self, data):
+        self.layout = {}
+        super().render(data)
 
 
 # Press the green button in the gutter to run the script.
@@ -1,31 +1,143 @@
-import io
-
 from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.pdfgen import canvas
-from PIL import Image as PilImage
-from reportlab.platypus import Table, Paragraph, Frame, ListFlowable, ListItem, Image
+from reportlab.platypus import ListFlowable, ListItem
+
+from assets import AssetImage, get_asset
+from form_layout import STYLE_SHEET, Field, FormTemplate, FrameSpec, Label, Section, TableSpec
+from pagination import overflows
+from paragraph_cache import build_paragraph, cached_paragraph
+from table_styles import compiled_table
 
 VERTICAL_MARGIN = 32
 HORIZONTAL_MARGIN = 32
 
+# Bullet style of the reasons and feedbacks lists
+LIST_STYLE = ParagraphStyle('GatePassBullet', parent=STYLE_SHEET["Bullet"],
+                            leftIndent=12,  # Indentation of the bullet list
+                            spaceAfter=8,  # Space after the bullet list
+                            textColor=colors.black,  # Color of the bullet list text
+                            fontSize=10)  # Font size of the bullet list text
+
+# Tallest a supervisor signature is drawn, as the row holding it has a fixed height
+SIGNATURE_HEIGHT = .3 * inch
+# Rows of the fields table hold one line of text between 10 points of padding, apart from the supervisor signature,
+# the vehicle label and note, and the ticks
+FIELDS_ROW_HEIGHTS = (32, 32, 32, 32, SIGNATURE_HEIGHT + 20, 47, 32, 32, .4 * inch + 20)
+FIELDS_TABLE_STYLE = [("SPAN", (0, 0), (3, 0)),
+                      ("SPAN", (0, 1), (3, 1)),
+                      ("SPAN", (0, 2), (3, 2)),
+                      ("SPAN", (0, 3), (3, 3)),
+                      ("SPAN", (0, 4), (3, 4)),
+                      ("SPAN", (0, 5), (3, 5)),
+                      ("SPAN", (0, 6), (3, 6)),
+                      ("SPAN", (0, 7), (3, 7)),
+                      ("SPAN", (4, 0), (7, 0)),
+                      ("SPAN", (4, 1), (7, 1)),
+                      ("SPAN", (4, 2), (7, 2)),
+                      ("SPAN", (4, 3), (7, 3)),
+                      ("SPAN", (4, 4), (7, 4)),
+                      ("SPAN", (4, 5), (7, 5)),
+                      ("SPAN", (4, 6), (7, 6)),
+                      ("SPAN", (4, 7), (7, 7)),
+                      ("SPAN", (0, 8), (1, 8)),
+                      ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                      ('TOPPADDING', (0, 0), (-1, -1), 10),
+                      ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+                      ('ALIGN', (3, 8), (4, 8), 'CENTER'),
+                      ('ALIGN', (5, 8), (6, 8), 'CENTER'),
+                      ('ALIGN', (7, 8), (-1, 8), 'CENTER'),
+                      ]
+# The table is closed at the bottom by the reasons and feedbacks table below it
+FIELDS_TABLE_LINES = [('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+                      ('LINEABOVE', (0, 0), (-1, 0), 1, colors.black),
+                      ('LINEBEFORE', (0, 0), (0, -1), 1, colors.black),
+                      ('LINEAFTER', (-1, 0), (-1, -1), 1, colors.black),
+                      ]
+
+FIELDS_TABLE = TableSpec('GatePassFields', [
+    [Label('title_paragraph', 'STAFF NAME'), '', '', '', Field('name')],
+    [Label('title_paragraph', 'POSITION'), '', '', '', Field('position')],
+    [Label('title_paragraph', 'DEPARTMENT'), '', '', '', Field('department')],
+    [Label('title_paragraph', 'NAME OF SUPERVISION'), '', '', '', Field('supervisor_name')],
+    [Label('title_paragraph', 'SIGNATURE OF SUPERVISOR'), '', '', '',
+     Field('supervisor_signature', 'fitted_signature')],
+    [Label('title_note', 'VEHICLE REG. NO', '(Only Required for Official Duty)'), '', '', '',
+     Field('vehicle_licence', 'content_paragraph')],
+    [Label('title_paragraph', 'DEPARTURE TIME'), '', '', '', Field('departure_time', 'content_paragraph')],
+    [Label('title_paragraph', 'RETURN TIME'), '', '', '', Field('return_time', 'content_paragraph')],
+    [Label('title_note', 'TYPE OF GATE PASS', '(Check Appropriate Box)'), '',
+     Label('title_paragraph', 'OFFICIAL'), Field('type', 'type_tick', 1),
+     Label('title_paragraph', 'PERSONAL'), Field('type', 'type_tick', 2),
+     Label('title_paragraph', 'LUNCHTIME'), Field('type', 'type_tick', 3)]],
+    FIELDS_TABLE_STYLE, FIELDS_TABLE_LINES, heights=FIELDS_ROW_HEIGHTS)
+
+# The reasons and feedbacks row, then the signature row, below the fields table
+TABLE_STYLE = [('LINEBEFORE', (0, 0), (0, -1), 1, colors.black),
+               ('LINEAFTER', (-1, 0), (-1, -1), 1, colors.black),
+               ('LINEBELOW', (0, -1), (-1, -1), 1, colors.black),
+               ('GRID', (0, 0), (-1, 0), 0.5, colors.black),
+               ("SPAN", (0, 0), (3, 0)),
+               ("SPAN", (4, 0), (7, 0)),
+               ("SPAN", (0, 1), (1, 1)),
+               ("SPAN", (2, 1), (3, 1)),
+               ("SPAN", (4, 1), (5, 1)),
+               ("SPAN", (6, 1), (7, 1)),
+               ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+               ('TOPPADDING', (0, 0), (-1, -1), 10),
+               ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+               ('ALIGN', (3, 0), (4, 0), 'CENTER'),
+               ('ALIGN', (5, 0), (6, 0), 'CENTER'),
+               ('ALIGN', (7, 0), (-1, 0), 'CENTER'),
+               ('ALIGN', (0, 1), (2, -1), 'CENTER'),
+               ('ALIGN', (4, 1), (6, -1), 'CENTER'),
+               ('VALIGN', (0, 1), (-1, -1), 'BOTTOM'),
+               ('LINEAFTER', (2, 1), (3, -1), 0.5, colors.black),
+               ]
 
-class GatePassTemplate:
 
-    def __init__(self, response_type='file', filename='print-review.pdf'):
-        if response_type == 'file':
-            self.canvas = canvas.Canvas(filename)
+def split_table_style(list_rows):
+    # TABLE_STYLE with the reasons and feedbacks row 0 spread over list_rows rows, so the table can split between
+    # bullets, and the signature row moved below them
+    last = list_rows - 1
+
+    def row(index, end=False):
+        if index == 0:
+            return last if end else 0
+        return last + 1
+
+    style = []
+    for command in TABLE_STYLE:
+        name, (start_column, start_row), (end_column, end_row) = command[:3]
+        if name == 'SPAN' and start_row == 0:
+            style += [(name, (start_column, r), (end_column, r)) for r in range(last + 1)]
+        elif name == 'GRID':
+            style.append(('LINEABOVE', (start_column, 0), (end_column, 0)) + command[3:])
         else:
-            buffer = io.BytesIO()
-            self.canvas = canvas.Canvas(buffer)
-        self.page_width, self.page_height = self.canvas._pagesize
-        self.table_frame = Frame(HORIZONTAL_MARGIN, VERTICAL_MARGIN, self.page_width - 2 * HORIZONTAL_MARGIN,
-                                 self.page_height - 2 * VERTICAL_MARGIN - 135, showBoundary=0)
-        self.styleSheet = getSampleStyleSheet()
-        self.table_frame_content = []
-        self.response_type = response_type
-        self.types = ('official', 'personal', 'lunchtime')
+            style.append((name, (start_column, row(start_row)), (end_column, row(end_row, True))) + command[3:])
+    return style + [('LINEAFTER', (3, 0), (3, last), 0.5, colors.black),
+                    ('LINEBELOW', (0, last), (-1, last), 0.5, colors.black),
+                    ('LINEBELOW', (0, 'splitlast'), (-1, 'splitlast'), 1, colors.black),
+                    ('LINEABOVE', (0, 'splitfirst'), (-1, 'splitfirst'), 1, colors.black),
+                    ('VALIGN', (0, 0), (-1, last), 'TOP'),
+                    ('TOPPADDING', (0, 1), (-1, last), 0),
+                    ('BOTTOMPADDING', (0, 0), (-1, last - 1), 0)]
+
+
+class GatePassTemplate(FormTemplate):
+    pagesize = A4
+    # Part of render cache keys, bump it when the layout changes so earlier renders are not served
+    version = 3
+    margins = (HORIZONTAL_MARGIN, VERTICAL_MARGIN)
+    frame_specs = (FrameSpec('table', (0, HORIZONTAL_MARGIN), (0, VERTICAL_MARGIN), (1, 0), (1, -135), flows=True),)
+    # A table too long for the first page continues on pages without the header
+    continuation_spec = FrameSpec('continuation', (0, HORIZONTAL_MARGIN), (0, VERTICAL_MARGIN), (1, 0), (1, 0))
+    sections = (Section('draw_header', static=True),
+                Section('draw_fields', frame='table', table=FIELDS_TABLE),
+                Section('draw_table', frame='table'))
+    background = 'GatePassHeader'
+    types = ('official', 'personal', 'lunchtime')
 
     def draw_title(self, title):
         self.canvas.setFont("Helvetica", 16)
@@ -34,7 +146,7 @@ class GatePassTemplate:
     def draw_logo(self):
         # Load the image
         image_path = "kmc-doc-logo.jpg"
-        image = PilImage.open(image_path)
+        image = get_asset(image_path)
         aspect_ratio = image.width / image.height
 
         # Set the desired width and height of the image
@@ -48,70 +160,39 @@ class GatePassTemplate:
         y = self.page_height - 150
 
         # Draw the image on the canvas
-        self.canvas.drawImage(image_path, x, y, width=image_width, height=image_height)
-
-    def title_paragraph(self, title):
-        return Paragraph('''
-                   <para align=left fontSize=9 spaceb=3><b>{:}<font color=black></font></b></para>'''.format(title),
-                         self.styleSheet["BodyText"])
+        image.draw(self.canvas, x, y, image_width, image_height)
 
     def list_item(self, text):
-        return Paragraph('''
+        return cached_paragraph('''
                        <para align=left fontSize=9 spaceb=3><bullet>{:}</bullet></para>'''.format(text),
-                         self.styleSheet["BodyText"])
+                                self.styleSheet["BodyText"])
 
-    def content_paragraph(self, text):
-        return Paragraph('''
-                   <para align=left fontSize=9 spaceb=3>{:}</para>'''.format(text),
-                         self.styleSheet["BodyText"])
+    @staticmethod
+    def chosen_type():
+        return AssetImage(get_asset('tick.png'), .4 * inch)
 
-    def signature_label(self, text):
-        return Paragraph('''
-                   <para align=center fontSize=10 spaceBefore=0>{:}</para>'''.format(text),
-                         self.styleSheet["BodyText"])
+    def type_tick(self, value, number):
+        return self.chosen_type() if value == number else ''
 
-    @staticmethod
-    def draw_signature(url):
-        image = Image(url)
-        image.drawHeight = .5 * inch * image.drawHeight / image.drawWidth
-        image.drawWidth = .5 * inch
-        return image
+    def title_note(self, title, note):
+        return [self.title_paragraph(title), self.content_paragraph(note)]
 
-    @staticmethod
-    def chosen_type():
-        image = Image('tick.png')
-        image.drawHeight = .4 * inch * image.drawHeight / image.drawWidth
-        image.drawWidth = .4 * inch
-        return image
+    def fitted_signature(self, url):
+        # Narrowed where it is too tall for its row
+        image = self.signature(url)
+        width, height = image.scaled(.5 * inch)
+        return AssetImage(image, min(width, width * SIGNATURE_HEIGHT / height))
 
-    def draw_table(self, payload):
-        reason_title = [self.title_paragraph('Reasons for leaving duty station during working hours:')]
-        feedback_title = [self.title_paragraph('Feedback to the responsible supervising officer (For official duty '
-                                               'only)')]
-        reason_text = payload['reasons']
-        feedback_text = payload['feedbacks']
-
-        # Create a ListStyle with desired bullet style
-        list_style = getSampleStyleSheet()["Bullet"]
-        list_style.leftIndent = 12  # Indentation of the bullet list
-        list_style.spaceAfter = 8  # Space after the bullet list
-        list_style.textColor = colors.black  # Color of the bullet list text
-        list_style.fontSize = 10  # Font size of the bullet list text
+    @staticmethod
+    def image_paths(data):
+        return ('kmc-doc-logo.jpg', 'tick.png', data['supervisor_signature'], data['employee_approval']['signature'],
+                data['feedback_approval']['signature'])
 
+    @staticmethod
+    def bullet_list(items):
         # Create a ListFlowable with the data and style
-        reason_list = ListFlowable(
-            [ListItem(Paragraph(item, list_style), leftIndent=20, value="\u2022") for item in reason_text],
-            bulletType="bullet",
-            bulletColor=colors.black,  # Color of the bullet
-            start=None,
-            end=None,
-            bulletFontSize=12,  # Font size of the bullet
-            bulletOffsetY=-2,  # Offset of the bullet from the text baseline
-            bulletDedent="auto",  # Dedentation of the bullet from the left
-            bulletDir="ltr",  # Bullet direction (left-to-right)
-        )
-        feedback_list = ListFlowable(
-            [ListItem(Paragraph(item, list_style), leftIndent=20, value="\u2022") for item in feedback_text],
+        return ListFlowable(
+            [ListItem(build_paragraph(item, LIST_STYLE), leftIndent=20, value="\u2022") for item in items],
             bulletType="bullet",
             bulletColor=colors.black,  # Color of the bullet
             start=None,
@@ -122,94 +203,49 @@ class GatePassTemplate:
             bulletDir="ltr",  # Bullet direction (left-to-right)
         )
 
-        reasons = [reason_title, reason_list]
-        feedbacks = [feedback_title, feedback_list]
-
-        data = [[self.title_paragraph('STAFF NAME'), '', '', '', payload['name']],
-                [self.title_paragraph('POSITION'), '', '', '', payload['position']],
-                [self.title_paragraph('DEPARTMENT'), '', '', '', payload['department']],
-                [self.title_paragraph('NAME OF SUPERVISION'), '', '', '', payload['supervisor_name']],
-                [self.title_paragraph('SIGNATURE OF SUPERVISOR'), '', '', '', self.draw_signature(payload['supervisor_signature'])],
-                [[self.title_paragraph('VEHICLE REG. NO'), self.content_paragraph('(Only Required for Official Duty)')],
-                 '', '',
-                 '',
-                 self.content_paragraph(payload['vehicle_licence'])],
-                [self.title_paragraph('DEPARTURE TIME'), '', '', '', self.content_paragraph(payload['departure_time'])],
-                [self.title_paragraph('RETURN TIME'), '', '', '', self.content_paragraph(payload['return_time'])],
-                [[self.title_paragraph('TYPE OF GATE PASS'), self.content_paragraph('(Check Appropriate Box)')], '',
-                 self.title_paragraph('OFFICIAL'), self.chosen_type() if payload['type'] == 1 else '',
-                 self.title_paragraph('PERSONAL'), self.chosen_type() if payload['type'] == 2 else '',
-                 self.title_paragraph('LUNCHTIME'), self.chosen_type() if payload['type'] == 3 else ''],
-                [reasons,
-                 '', '', '',
-                 feedbacks],
-                [[self.draw_signature(payload['employee_approval']['signature']),
-                  self.signature_label('---------------------------'),
-                  self.signature_label('Signature')], '',
-                 [self.signature_label(payload['employee_approval']['date']),
-                  self.signature_label('---------------------------'),
-                  self.signature_label('Date')], '',
-                 [self.draw_signature(payload['feedback_approval']['signature']),
-                  self.signature_label('---------------------------'),
-                  self.signature_label('Signature')], '',
-                 [self.signature_label(payload['feedback_approval']['date']),
-                  self.signature_label('---------------------------'),
-                  self.signature_label('Date')]]]
-        t = Table(data, style=[('BOX', (0, 0), (-1, -1), 1, colors.black),
-                               ('GRID', (0, 0), (-1, -2), 0.5, colors.black),
-                               ("SPAN", (0, 0), (3, 0)),
-                               ("SPAN", (0, 1), (3, 1)),
-                               ("SPAN", (0, 2), (3, 2)),
-                               ("SPAN", (0, 3), (3, 3)),
-                               ("SPAN", (0, 4), (3, 4)),
-                               ("SPAN", (0, 5), (3, 5)),
-                               ("SPAN", (0, 6), (3, 6)),
-                               ("SPAN", (0, 7), (3, 7)),
-                               ("SPAN", (4, 0), (7, 0)),
-                               ("SPAN", (4, 1), (7, 1)),
-                               ("SPAN", (4, 2), (7, 2)),
-                               ("SPAN", (4, 3), (7, 3)),
-                               ("SPAN", (4, 4), (7, 4)),
-                               ("SPAN", (4, 5), (7, 5)),
-                               ("SPAN", (4, 6), (7, 6)),
-                               ("SPAN", (4, 7), (7, 7)),
-                               ("SPAN", (0, 9), (3, 9)),
-                               ("SPAN", (4, 9), (7, 9)),
-                               ("SPAN", (0, 10), (1, 10)),
-                               ("SPAN", (2, 10), (3, 10)),
-                               ("SPAN", (4, 10), (5, 10)),
-                               ("SPAN", (6, 10), (7, 10)),
-                               ("SPAN", (0, 8), (1, 8)),
-                               ('VALIGN', (0, 0), (9, -1), 'MIDDLE'),
-                               ('TOPPADDING', (0, 0), (-1, -1), 10),
-                               ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-                               ('ALIGN', (3, 8), (4, 9), 'CENTER'),
-                               ('ALIGN', (5, 8), (6, 9), 'CENTER'),
-                               ('ALIGN', (7, 8), (-1, 9), 'CENTER'),
-                               ('ALIGN', (0, 10), (2, -1), 'CENTER'),
-                               ('ALIGN', (4, 10), (6, -1), 'CENTER'),
-                               ('VALIGN', (0, 10), (-1, -1), 'BOTTOM'),
-                               ('LINEAFTER', (2, 10), (3, -1), 0.5, colors.black),
-                               ])
-        t._argW[3] = 1.5 * inch
-        # Calculate the width of each column
-        num_columns = 8  # Assuming all rows have the same number of columns
-        column_width = self.table_frame.width / num_columns
-
-        # Create a list of equal widths for all columns
-        column_widths = [column_width] * num_columns
-        # Set the column widths for the table
-        t._argW = column_widths
-
-        self.table_frame_content.append(t)
-
-    def generate(self, data):
+    def list_titles(self):
+        return (self.title_paragraph('Reasons for leaving duty station during working hours:'),
+                self.title_paragraph('Feedback to the responsible supervising officer (For official duty only)'))
+
+    def signature_row(self, payload):
+        return [[self.draw_signature(payload['employee_approval']['signature']),
+                 self.signature_label('---------------------------'),
+                 self.signature_label('Signature')], '',
+                [self.signature_label(payload['employee_approval']['date']),
+                 self.signature_label('---------------------------'),
+                 self.signature_label('Date')], '',
+                [self.draw_signature(payload['feedback_approval']['signature']),
+                 self.signature_label('---------------------------'),
+                 self.signature_label('Signature')], '',
+                [self.signature_label(payload['feedback_approval']['date']),
+                 self.signature_label('---------------------------'),
+                 self.signature_label('Date')]]
+
+    def draw_table(self, payload):
+        reason_title, feedback_title = self.list_titles()
+        reasons = [[reason_title], self.bullet_list(payload['reasons'])]
+        feedbacks = [[feedback_title], self.bullet_list(payload['feedbacks'])]
+        data = [[reasons, '', '', '', feedbacks, '', '', ''], self.signature_row(payload)]
+        t = compiled_table('GatePassTable', data, TABLE_STYLE, self.frames['table'].width)
+        # Measured below the fields table, which is laid out first
+        if overflows(self.frames['table'], self.content['table'] + [t]):
+            t = self.split_table(payload)
+        return [t]
+
+    def split_table(self, payload):
+        # Reasons and feedbacks too long for the page: one row per bullet lets the table split between pages
+        reason_title, feedback_title = self.list_titles()
+        reasons, feedbacks = payload['reasons'], payload['feedbacks']
+        rows = [[reason_title, '', '', '', feedback_title, '', '', '']]
+        for index in range(max(len(reasons), len(feedbacks))):
+            rows.append([self.bullet_list(reasons[index:index + 1]), '', '', '',
+                         self.bullet_list(feedbacks[index:index + 1])])
+        data = rows + [self.signature_row(payload)]
+        return compiled_table('GatePassSplitTable', data, split_table_style(len(rows)), self.frames['table'].width)
+
+    def draw_header(self):
         self.draw_logo()
         self.draw_title('GATE PASS')
-        self.draw_table(data)
-
-        self.table_frame.addFromList(self.table_frame_content, self.canvas)
-        self.canvas.save()
 
 
 # Press the green button in the gutter to run the script.
@@ -0,0 +1,247 @@
+import csv
+import json
+import os
+import queue
+import threading
+
+from batch import iter_render_batch
+
+CSV = 'csv'
+JSONL = 'jsonl'
+# Separates the bullets of a list field held in a single CSV cell
+LIST_SEPARATOR = '|'
+GATE_PASS_TYPES = ('official', 'personal', 'lunchtime')
+# Signature values with these extensions are image files, anything else may be an employee ID or name such as
+# "Dr. Okello"
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff')
+
+
+def text(value):
+    return str(value).strip()
+
+
+def signature(value):
+    # An image file, or an employee ID or name for templates given a signature store. Values with an image
+    # extension must exist, so a mistyped path is still caught here rather than at render time.
+    value = text(value)
+    if os.path.isfile(value) or os.path.splitext(value)[1].lower() not in IMAGE_EXTENSIONS:
+        return value
+    raise ValueError('image {:} does not exist'.format(value))
+
+
+def bullets(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(text(item) for item in value)
+    return tuple(item.strip() for item in text(value).split(LIST_SEPARATOR) if item.strip())
+
+
+def gate_pass_type(value):
+    value = text(value).lower()
+    if value in GATE_PASS_TYPES:
+        return GATE_PASS_TYPES.index(value) + 1
+    if value not in ('1', '2', '3'):
+        raise ValueError('type must be 1, 2, 3 or one of {:}'.format(', '.join(GATE_PASS_TYPES)))
+    return int(value)
+
+
+# Dotted paths into the nested payload, how to convert each value and whether it may be left blank
+GATE_PASS_FIELDS = (('name', text, False),
+                    ('position', text, False),
+                    ('department', text, False),
+                    ('supervisor_name', text, False),
+                    ('supervisor_signature', signature, False),
+                    ('vehicle_licence', text, True),
+                    ('departure_time', text, False),
+                    ('return_time', text, False),
+                    ('type', gate_pass_type, False),
+                    ('reasons', bullets, False),
+                    ('feedbacks', bullets, True),
+                    ('employee_approval.signature', signature, False),
+                    ('employee_approval.date', text, False),
+                    ('feedback_approval.signature', signature, False),
+                    ('feedback_approval.date', text, False))
+OFFICER_FIELDS = (('name', text, False), ('position', text, False), ('signature', signature, False),
+                  ('date', text, False))
+# Checking, approval and accountability come after the form is rendered and are stamped in later, so their
+# signatures and dates may be left blank
+PENDING_OFFICER_FIELDS = (('name', text, False), ('position', text, False), ('signature', signature, True),
+                          ('date', text, True))
+ACCOUNTABILITY_FIELDS = (('name', text, False), ('signature', signature, True), ('date', text, True))
+TRIP_FIELDS = (('date', text, False),
+               ('purpose', text, False),
+               ('distance', text, False),
+               ('rate', text, False),
+               ('amount', text, False))
+FUEL_FORM_FIELDS = (
+    (('vehicle.vehicle_licence', text, False),
+     ('vehicle.vehicle_model', text, False),
+     ('vehicle.engine_capacity', text, False),
+     ('vehicle.fuel_card_no', text, False),
+     ('business.amount_in_words', text, False),
+     ('business.amount_not_taken', text, True))
+    + tuple(('approval.prepared.{:}'.format(field), convert, blank) for field, convert, blank in OFFICER_FIELDS)
+    + tuple(('approval.{:}.{:}'.format(officer, field), convert, blank)
+            for officer in ('checked', 'approved') for field, convert, blank in PENDING_OFFICER_FIELDS)
+    + (('receipt.name', text, False),
+       ('receipt.signature', signature, False),
+       ('receipt.card_number', text, False),
+       ('receipt.benefactor', text, False),
+       ('receipt.benefactor_signature', signature, False),
+       ('receipt.date', text, False))
+    + tuple(('accountability.{:}.{:}'.format(officer, field), convert, blank)
+            for officer in ('checked', 'verified') for field, convert, blank in ACCOUNTABILITY_FIELDS))
+
+SCHEMAS = {'GatePassTemplate': GATE_PASS_FIELDS, 'FuelFormTemplate': FUEL_FORM_FIELDS}
+
+
+def input_format(path, format=None):
+    return format or (CSV if path.lower().endswith('.csv') else JSONL)
+
+
+def read_rows(path, format=None):
+    # Yields (line number, row) pairs without reading the file ahead of the consumer. JSONL lines are yielded as
+    # text and parsed by parse_row, so a malformed line is reported like any other invalid row.
+    format = input_format(path, format)
+    with open(path, newline='' if format == CSV else None, encoding='utf-8') as f:
+        if format == CSV:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    yield line_number, line
+
+
+def parse_row(row, format):
+    # Rows that cannot be a record raise ValueError, as invalid fields do
+    if format == JSONL:
+        row = json.loads(row)
+        if not isinstance(row, dict):
+            raise ValueError('expected a JSON object, not {:}'.format(type(row).__name__))
+    elif None in row:
+        # DictReader puts the values of cells beyond the header under None
+        raise ValueError('{:} more cells than columns'.format(len(row[None])))
+    elif None in row.values():
+        raise ValueError('no cells for {:}'.format(', '.join(name for name, value in row.items() if value is None)))
+    return row
+
+
+def unflatten(row):
+    # Flat columns such as approval.prepared.name become nested dicts, nested JSON passes through unchanged
+    payload = {}
+    for key, value in row.items():
+        target = payload
+        *parents, name = key.split('.')
+        for parent in parents:
+            target = target.setdefault(parent, {})
+            if not isinstance(target, dict):
+                raise ValueError('{:} is not an object'.format(parent))
+        if isinstance(value, dict) and isinstance(target.get(name), dict):
+            target[name].update(value)
+        else:
+            target[name] = value
+    return payload
+
+
+def convert_fields(payload, fields):
+    for path, convert, blank in fields:
+        *parents, name = path.split('.')
+        target = payload
+        for parent in parents:
+            target = target.get(parent)
+            if not isinstance(target, dict):
+                raise ValueError('missing {:}'.format(parent))
+        value = target.get(name)
+        if value is None or value == '' or value == []:
+            if not blank:
+                raise ValueError('missing {:}'.format(path))
+            target[name] = convert('')
+            continue
+        try:
+            target[name] = convert(value)
+        except ValueError as e:
+            raise ValueError('{:}: {:}'.format(path, e))
+
+
+def to_payload(row, template_name):
+    payload = unflatten(row)
+    convert_fields(payload, SCHEMAS[template_name])
+    if template_name == 'FuelFormTemplate':
+        business = payload['business']
+        # A business section either lists its trips or is a single trip of its own
+        for trip in business['trips'] if 'trips' in business else (business,):
+            if not isinstance(trip, dict):
+                raise ValueError('trips must be objects')
+            convert_fields(trip, TRIP_FIELDS)
+    return payload
+
+
+def validated_rows(path, template_name, format=None):
+    # (line number, payload, None) for valid rows and (line number, None, error) for invalid ones, errors starting
+    # with path:line
+    format = input_format(path, format)
+    for line_number, row in read_rows(path, format):
+        try:
+            yield line_number, to_payload(parse_row(row, format), template_name), None
+        except (ValueError, KeyError, TypeError) as e:
+            yield line_number, None, ValueError('{:}:{:}: {:}'.format(path, line_number, e))
+
+
+def iter_payloads(path, template_name, format=None, on_error=None, read_ahead=False):
+    # Invalid rows go to on_error(line number, error) and are skipped, or stop the run when it is None. read_ahead
+    # parses on a thread ahead of the consumer, while on_error still runs in the consumer's thread.
+    rows = validated_rows(path, template_name, format)
+    if read_ahead:
+        rows = prefetch(rows)
+    for line_number, payload, error in rows:
+        if error is None:
+            yield payload
+        elif on_error is None:
+            raise error
+        else:
+            on_error(line_number, error)
+
+
+def prefetch(iterable, size=256):
+    # Runs the producer in a thread with a bounded queue, so parsing overlaps rendering in constant memory
+    items = queue.Queue(size)
+    done = object()
+    stop = threading.Event()
+
+    def put(entry):
+        # Gives up once the consumer has stopped reading, rather than blocking on a full queue for good
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as e:
+            put((done, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def render_records(template_class, path, format=None, on_error=None, **batch_options):
+    payloads = iter_payloads(path, template_class.__name__, format, on_error, read_ahead=True)
+    return iter_render_batch(template_class, payloads, **batch_options)
@@ -0,0 +1,128 @@
+import cProfile
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+_local = threading.local()
+# Shared no-op context returned while nothing is being recorded, so disabled hooks cost one attribute lookup
+_off = nullcontext()
+
+
+class RenderStats:
+
+    def __init__(self):
+        self.phases = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.elapsed = 0.0
+        # cProfile.Profile for sampled renders, None otherwise
+        self.profile = None
+
+
+class Instrument:
+
+    def __init__(self, callback=None, profile_fraction=0.0):
+        self.callback = callback
+        self.profile_fraction = profile_fraction
+        self.renders = 0
+        self.phases = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'instrument', None)
+        _local.instrument = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        _local.instrument = self.previous
+
+    def add_time(self, name, seconds):
+        render = getattr(_local, 'render', None)
+        if render is not None:
+            render.phases[name] += seconds
+        with self.lock:
+            self.phases[name] += seconds
+
+    def add_count(self, name, amount):
+        render = getattr(_local, 'render', None)
+        if render is not None:
+            render.counters[name] += amount
+        with self.lock:
+            self.counters[name] += amount
+
+    def finish(self, stats):
+        with self.lock:
+            self.renders += 1
+        if self.callback is not None:
+            self.callback(stats)
+
+    def summary(self):
+        with self.lock:
+            return {'renders': self.renders, 'phases': dict(self.phases), 'counters': dict(self.counters)}
+
+
+class _Phase:
+
+    def __init__(self, instrument, name):
+        self.instrument = instrument
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.instrument.add_time(self.name, time.perf_counter() - self.started)
+
+
+class _RenderScope:
+
+    def __init__(self, instrument):
+        self.instrument = instrument
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'render', None)
+        self.stats = _local.render = RenderStats()
+        # Only one profiler can run per thread, so nested renders are never sampled
+        fraction = self.instrument.profile_fraction
+        if fraction and self.previous is None and random.random() < fraction:
+            self.stats.profile = cProfile.Profile()
+            self.stats.profile.enable()
+        self.started = time.perf_counter()
+        return self.stats
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stats.elapsed = time.perf_counter() - self.started
+        if self.stats.profile is not None:
+            self.stats.profile.disable()
+        _local.render = self.previous
+        self.instrument.finish(self.stats)
+
+
+def instrument(callback=None, profile_fraction=0.0):
+    return Instrument(callback, profile_fraction)
+
+
+def recording():
+    return getattr(_local, 'instrument', None) is not None
+
+
+def phase(name):
+    current = getattr(_local, 'instrument', None)
+    if current is None:
+        return _off
+    return _Phase(current, name)
+
+
+def render_scope():
+    current = getattr(_local, 'instrument', None)
+    if current is None:
+        return _off
+    return _RenderScope(current)
+
+
+def count(name, amount=1):
+    current = getattr(_local, 'instrument', None)
+    if current is not None:
+        current.add_count(name, amount)
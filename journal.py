@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+
+
+class Journal:
+    # Append-only JSON lines of finished records, so a rerun of an interrupted batch skips work already written.
+    # Records are known by a hash of their payload and the template options, so a rerun over an edited or reordered
+    # input renders the records that changed rather than trusting their position.
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        content = ''
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                content = f.read()
+            for line in content.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash can cut the last line short
+                    continue
+                if 'key' in entry:
+                    self.entries[entry['key']] = entry
+        self.file = open(path, 'a', encoding='utf-8')
+        if content and not content.endswith('\n'):
+            self.file.write('\n')
+
+    @staticmethod
+    def key(payload, template_options=None):
+        content = json.dumps([payload, template_options or {}], sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def finished(self, key, filename):
+        # The size check catches outputs that were replaced or truncated after they were journaled, or whose rename
+        # did not survive a crash
+        entry = self.entries.get(key)
+        if entry is None or entry['filename'] != filename:
+            return False
+        try:
+            return os.path.getsize(filename) == entry['size']
+        except OSError:
+            return False
+
+    def record(self, key, index, filename):
+        # The output reaches the disk before the line claiming it does, and the line before the record is reported
+        with open(filename, 'rb') as f:
+            os.fsync(f.fileno())
+            size = os.fstat(f.fileno()).st_size
+        entry = {'key': key, 'index': index, 'filename': filename, 'size': size}
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.entries[key] = entry
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
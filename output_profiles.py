@@ -0,0 +1,134 @@
+import io
+import threading
+import zlib
+from collections import OrderedDict
+
+from PIL import Image
+from reportlab.pdfbase.pdfdoc import PDFBase85Encode, PDFFormXObject, PDFImageXObject, PDFStream
+from reportlab.pdfbase.pdfutils import asciiBase85Decode, asciiBase85Encode
+
+from instrumentation import count
+
+# Output profiles trade save time for bytes. Reportlab picks its stream filters from process-wide settings while a
+# document is drawn, so a profile re-encodes the page streams, forms and images of one document just before it is
+# saved. Reportlab's own output, ASCII85 wrapped and compressed at zlib's default level, is used when no profile is
+# given. Object streams are not offered: reportlab writes classic cross-reference tables only, which stamping relies
+# on too.
+
+
+class FlateFilter:
+    pdfname = 'FlateDecode'
+
+    def __init__(self, level):
+        self.level = level
+
+    def encode(self, text):
+        if isinstance(text, str):
+            text = text.encode('utf8')
+        return zlib.compress(text, self.level)
+
+
+class OutputProfile:
+    # level is the zlib level of page and form streams, None leaves them uncompressed. ascii85 wraps every binary
+    # stream in ASCII85 as reportlab does by default, a quarter larger but 7-bit clean. Flate images are
+    # recompressed at image_level, or kept as reportlab compressed them when it is None, and JPEG images are kept
+    # as they are unless jpeg_quality asks for a re-encode that comes out smaller.
+
+    def __init__(self, name, level=None, ascii85=False, image_level=6, jpeg_quality=None):
+        self.name = name
+        self.level = level
+        self.ascii85 = ascii85
+        self.image_level = image_level
+        self.jpeg_quality = jpeg_quality
+        self.filters = None
+        if level is not None:
+            self.filters = [PDFBase85Encode, FlateFilter(level)] if ascii85 else [FlateFilter(level)]
+
+    def stream(self, content, comment):
+        stream = PDFStream(content=content, filters=self.filters)
+        stream.__Comment__ = comment
+        return stream
+
+    def apply(self, document):
+        for page in document.Pages.pages:
+            if page.stream and not page.Contents:
+                page.Contents = self.stream(page.stream, 'page stream')
+        for xobject in list(document.idToObject.values()):
+            if isinstance(xobject, PDFFormXObject) and xobject.stream and not xobject.Contents:
+                # Forms apply reportlab's filters when compressed, whatever their contents already have
+                xobject.compression = 0
+                xobject.Contents = self.stream(xobject.stream, 'xobject form stream')
+            elif isinstance(xobject, PDFImageXObject):
+                xobject.streamContent, xobject._filters = images.get(xobject, self)
+
+
+PROFILES = {
+    # Reportlab's own output
+    'default': None,
+    # Smallest save time: page streams left uncompressed, images copied through as binary
+    'fast': OutputProfile('fast', image_level=None),
+    # Cheap compression, nearly the size of archive at a fraction of its save time
+    'compact': OutputProfile('compact', level=1, image_level=6),
+    # Smallest lossless files
+    'archive': OutputProfile('archive', level=9, image_level=9),
+    # Smaller still, but JPEG images such as the logo lose some detail
+    'small': OutputProfile('small', level=9, image_level=9, jpeg_quality=75),
+}
+
+
+def output_profile(profile):
+    # A profile by name, None for reportlab's own output
+    if profile is None or isinstance(profile, OutputProfile):
+        return profile
+    if profile not in PROFILES:
+        raise ValueError('Unknown output profile: {:}'.format(profile))
+    return PROFILES[profile]
+
+
+class _EncodedImages:
+    # Image streams re-encoded for a profile, keyed by the name reportlab derives from the pixels, so an image is
+    # encoded once per process instead of in every document
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, xobject, profile):
+        key = (xobject.name, profile.ascii85, profile.image_level, profile.jpeg_quality)
+        with self.lock:
+            encoded = self.entries.get(key)
+            if encoded is not None:
+                self.entries.move_to_end(key)
+        if encoded is not None:
+            count('profile_images_cached')
+            return encoded
+        encoded = _encode(xobject, profile)
+        with self.lock:
+            self.entries[key] = encoded
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        count('profile_images_encoded')
+        return encoded
+
+
+images = _EncodedImages()
+
+
+def _encode(xobject, profile):
+    data = xobject.streamContent
+    filters = list(xobject._filters)
+    if filters[:1] == ['ASCII85Decode']:
+        data = asciiBase85Decode(data)
+        filters = filters[1:]
+    if filters == ['FlateDecode'] and profile.image_level is not None:
+        data = zlib.compress(zlib.decompress(data), profile.image_level)
+    elif (filters == ['DCTDecode'] and profile.jpeg_quality is not None
+          and xobject.colorSpace in ('DeviceRGB', 'DeviceGray')):
+        output = io.BytesIO()
+        Image.open(io.BytesIO(data)).save(output, 'JPEG', quality=profile.jpeg_quality, optimize=True)
+        if output.tell() < len(data):
+            data = output.getvalue()
+    if profile.ascii85:
+        return asciiBase85Encode(data), tuple(['ASCII85Decode'] + filters)
+    return data, tuple(filters)
@@ -0,0 +1,46 @@
+from reportlab.platypus import LayoutError
+from reportlab.platypus.flowables import _FUZZ
+
+from instrumentation import count
+
+
+def overflows(frame, content):
+    # Whether content overruns the empty frame, measured the way Frame.add places it but without drawing
+    width = frame._getAvailableWidth()
+    available = frame._aH
+    used = 0
+    space_after = 0
+    for index, flowable in enumerate(content):
+        if index:
+            space = flowable.getSpaceBefore()
+            if frame._oASpace:
+                space = max(space - space_after, 0)
+            used += space_after + space
+        used += flowable.wrap(width, available - used)[1]
+        if used > available + _FUZZ:
+            return True
+        space_after = flowable.getSpaceAfter()
+    return False
+
+
+def flow(frame, content, canv, continuation):
+    # Draws content into frame and, where Frame.addFromList would leave the rest undrawn, splits the flowable that
+    # does not fit and carries on in the continuation frame on a new page
+    if frame.showBoundary:
+        frame.drawBoundary(canv)
+    while content:
+        if frame.add(content[0], canv, trySplit=1):
+            del content[0]
+            continue
+        pieces = frame.split(content[0], canv)
+        if pieces:
+            content[0:1] = pieces
+            continue
+        if frame._atTop:
+            raise LayoutError('{:} is too large for a continuation page'.format(content[0].__class__.__name__))
+        canv.showPage()
+        count('continuation_pages')
+        frame = continuation
+        frame._reset()
+        if frame.showBoundary:
+            frame.drawBoundary(canv)
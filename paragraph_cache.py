@@ -0,0 +1,125 @@
+import threading
+from collections import OrderedDict
+
+from reportlab.platypus import Paragraph
+from reportlab.platypus.flowables import _FUZZ
+from reportlab.platypus.paragraph import cleanBlockQuotedText, textTransformFrags
+from reportlab.platypus.paraparser import ParaParser
+
+from instrumentation import count
+
+
+class ParsedParagraph:
+
+    def __init__(self, text, style):
+        parser = ParaParser()
+        parser.caseSensitive = 1
+        # The parser returns a copy of the style with the <para> attributes applied
+        self.style, self.frags, bullet_frags = parser.parse(cleanBlockQuotedText(text), style)
+        if self.frags is None:
+            raise ValueError("xml parser error ({:}) in paragraph beginning\n'{:}'".format(parser.errors[0], text[:30]))
+        textTransformFrags(self.frags, self.style)
+        self.text = text
+        self.bulletText = bullet_frags or getattr(self.style, 'bulletText', None)
+        # Line breaking results keyed by available width
+        self.layouts = {}
+
+
+class CachedParagraph(Paragraph):
+
+    def __init__(self, parsed, cache):
+        self.parsed = parsed
+        self.cache = cache
+        super().__init__(parsed.text, parsed.style, parsed.bulletText, frags=parsed.frags)
+
+    def wrap(self, availWidth, availHeight):
+        if availWidth < _FUZZ:
+            return super().wrap(availWidth, availHeight)
+        layout = self.parsed.layouts.get(availWidth)
+        if layout is None:
+            with self.cache.lock:
+                self.cache.wrap_misses += 1
+            super().wrap(availWidth, availHeight)
+            self.parsed.layouts[availWidth] = (self.blPara, self._wrapWidths, self.width, self.height)
+        else:
+            with self.cache.lock:
+                self.cache.wrap_hits += 1
+            self.blPara, self._wrapWidths, self.width, self.height = layout
+        return self.width, self.height
+
+
+class MeasuredParagraph(Paragraph):
+    measured_width = None
+
+    def wrap(self, availWidth, availHeight):
+        # Keeps the line breaking of the last width, so measuring before layout does not break the lines twice.
+        # split() drops the line breaking when the paragraph has to move on whole.
+        if availWidth < _FUZZ:
+            return super().wrap(availWidth, availHeight)
+        if availWidth != self.measured_width or not hasattr(self, 'blPara'):
+            super().wrap(availWidth, availHeight)
+            self.measured_width = availWidth
+        return self.width, self.height
+
+
+class ParagraphCache:
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.wrap_hits = 0
+        self.wrap_misses = 0
+
+    @staticmethod
+    def style_key(style):
+        # Equal styles built separately, e.g. by getSampleStyleSheet(), share entries, so styles are compared by value
+        values = tuple(sorted((name, value) for name, value in style.__dict__.items() if name != 'parent'))
+        try:
+            hash(values)
+        except TypeError:
+            return id(style)
+        return values
+
+    def paragraph(self, text, style):
+        key = (text, self.style_key(style))
+        with self.lock:
+            parsed = self.entries.get(key)
+            if parsed is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        if parsed is None:
+            count('paragraphs_built')
+            parsed = ParsedParagraph(text, style)
+            with self.lock:
+                self.misses += 1
+                self.entries[key] = parsed
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        else:
+            count('paragraphs_cached')
+        return CachedParagraph(parsed, self)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'wrap_hits': self.wrap_hits,
+                    'wrap_misses': self.wrap_misses, 'entries': len(self.entries)}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+paragraph_cache = ParagraphCache()
+
+
+def cached_paragraph(text, style):
+    return paragraph_cache.paragraph(text, style)
+
+
+def build_paragraph(text, style):
+    # For text that is unlikely to repeat, e.g. bullets and paragraphs with inline signatures
+    count('paragraphs_built')
+    return MeasuredParagraph(text, style)
@@ -0,0 +1,535 @@
+import functools
+import io
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+from PIL import Image, ImageChops
+from reportlab.graphics import renderPM
+from reportlab.graphics.renderPM import PMCanvas
+from reportlab.graphics.shapes import FILL_EVEN_ODD, FILL_NON_ZERO, Drawing, Group
+from reportlab.graphics.shapes import Image as ImageShape
+from reportlab.graphics.utils import RenderPMError
+from reportlab.graphics.transform import mmult
+from reportlab.lib.colors import CMYKColor, Color, black
+from reportlab.lib.rl_accel import asciiBase85Decode
+from reportlab.pdfbase.pdfdoc import PDFImageXObject
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from batch import PER_RECORD, iter_render_batch
+from instrumentation import count, phase, render_scope
+from render_cache import RenderCache
+
+# PNG previews drawn with rlPyCairo from the same page the PDF would hold. The template renders onto its canvas as
+# usual, then the page content streams are replayed onto a renderPM canvas instead of being compressed and written,
+# so a preview costs the layout and the rasterization but none of the PDF output.
+
+# renderPM backend, listed in requirements.txt
+BACKEND = 'rlPyCairo'
+PREVIEW_DPI = 96
+THUMBNAIL_DPI = 36
+IDENTITY = (1, 0, 0, 1, 0, 0)
+
+TOKEN = re.compile(r'(\((?:\\.|[^\\()])*\)|<[0-9A-Fa-f\s]*>|\[|\]|/[^\s/<>\[\]()%]*|[^\s/<>\[\]()%]+)', re.S)
+ESCAPE = re.compile(r'\\([0-7]{1,3}|\r\n|.)', re.S)
+ESCAPES = {'n': '\n', 'r': '\r', 't': '\t', 'b': '\b', 'f': '\f', '\r\n': '', '\r': '', '\n': ''}
+IMAGE_MODES = {'DeviceGray': 'L', 'DeviceRGB': 'RGB', 'DeviceCMYK': 'CMYK'}
+
+
+class Name(str):
+    pass
+
+
+def _unescape(match):
+    escape = match.group(1)
+    if escape[0] in '01234567':
+        return chr(int(escape, 8) & 0xff)
+    return ESCAPES.get(escape, escape)
+
+
+def _string(token):
+    # Strings come back as the bytes they stand for, held in a latin-1 str
+    if token[0] == '(':
+        return ESCAPE.sub(_unescape, token[1:-1])
+    digits = re.sub(r'\s', '', token[1:-1])
+    return bytes.fromhex(digits + '0' * (len(digits) % 2)).decode('latin-1')
+
+
+def _operations(content):
+    # (operator, operands) for every operator of a content stream
+    if isinstance(content, bytes):
+        content = content.decode('latin-1')
+    operands = []
+    arrays = []
+    for token in TOKEN.findall(content):
+        first = token[0]
+        if first in '(<':
+            operands.append(_string(token))
+        elif first == '/':
+            operands.append(Name(token[1:]))
+        elif first == '[':
+            arrays.append(operands)
+            operands = []
+        elif first == ']':
+            array = operands
+            operands = arrays.pop()
+            operands.append(array)
+        elif first in '0123456789.+-':
+            operands.append(float(token))
+        else:
+            yield token, operands
+            operands = []
+
+
+class _Images:
+    # Decoded image XObjects by name. Reportlab names images by a hash of their pixels, so a decoded image serves
+    # every document that draws the same picture.
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, document, name):
+        with self.lock:
+            image = self.entries.get(name)
+            if image is not None:
+                self.entries.move_to_end(name)
+        if image is not None:
+            count('preview_images_cached')
+            return image
+        xobject = document.idToObject[name]
+        image = _decode(xobject)
+        smask = getattr(xobject, 'smask', None)
+        if smask is not None:
+            alpha = _decode(document.idToObject[smask.name])
+            # The templates draw every image on white paper, so transparency is flattened here once
+            image = Image.composite(image.convert('RGB'), Image.new('RGB', image.size, 'white'), alpha.convert('L'))
+        image = image.convert('RGB')
+        with self.lock:
+            self.entries[name] = image
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        count('preview_images_decoded')
+        return image
+
+
+def _decode(xobject):
+    data = xobject.streamContent
+    image = None
+    for name in xobject._filters:
+        if name == 'ASCII85Decode':
+            data = asciiBase85Decode(data)
+        elif name == 'FlateDecode':
+            data = zlib.decompress(data)
+        elif name == 'DCTDecode':
+            image = Image.open(io.BytesIO(data))
+            image.load()
+        else:
+            raise ValueError('Cannot preview images encoded with {:}'.format(name))
+    if image is None:
+        image = Image.frombytes(IMAGE_MODES[xobject.colorSpace], (xobject.width, xobject.height), data)
+    decode = getattr(xobject, '_decode', None)
+    if decode and decode[0] > decode[1]:
+        # Inverted CMYK JPEGs, as written by Photoshop
+        image = ImageChops.invert(image)
+    return image
+
+
+images = _Images()
+
+
+class _State:
+    # The parts of the PDF graphics state that the templates change
+
+    def __init__(self):
+        self.ctm = IDENTITY
+        self.fill = black
+        self.stroke = black
+        self.line_width = 1
+        self.line_cap = 0
+        self.line_join = 0
+        self.dash = None
+        # (ctm, path, fill mode) of every clip in force, intersected in order
+        self.clips = ()
+        self.font = None
+        self.font_size = 12
+        self.leading = 0
+        self.char_space = 0
+        self.word_space = 0
+        self.horizontal_scale = 1
+        self.rise = 0
+        self.render_mode = 0
+
+    def copy(self):
+        state = _State.__new__(_State)
+        state.__dict__.update(self.__dict__)
+        return state
+
+
+class PageRasterizer:
+    # Replays the operators reportlab writes into page content streams onto a renderPM canvas. Fonts are the
+    # standard Type 1 fonts the templates use, whose strings are WinAnsi encoded.
+
+    def __init__(self, document, width, height, dpi=PREVIEW_DPI):
+        self.document = document
+        try:
+            self.canvas = PMCanvas(width, height, dpi=dpi, backend=BACKEND)
+        except RenderPMError as e:
+            raise ImportError('Previews are drawn with {:}, install it with pip install {:}'.format(
+                BACKEND, BACKEND)) from e
+        self.base = self.canvas._baseCTM
+        self.fonts = {resource.lstrip('/'): font for font, resource in document.fontMapping.items()}
+        self.state = _State()
+        self.stack = []
+        self.path = []
+        self.clip = None
+        self.text_matrix = self.line_matrix = IDENTITY
+        self.operators = {
+            'q': self.save, 'Q': self.restore, 'cm': self.transform,
+            'w': self.set_line_width, 'J': self.set_line_cap, 'j': self.set_line_join, 'd': self.set_dash,
+            'g': self.set_fill_gray, 'G': self.set_stroke_gray, 'rg': self.set_fill_rgb, 'RG': self.set_stroke_rgb,
+            'k': self.set_fill_cmyk, 'K': self.set_stroke_cmyk,
+            'm': self.move_to, 'l': self.line_to, 'c': self.curve_to, 'v': self.curve_to_v, 'y': self.curve_to_y,
+            'h': self.close_path, 're': self.rectangle,
+            'S': self.stroke, 's': self.close_stroke, 'f': self.fill, 'F': self.fill, 'f*': self.fill_even_odd,
+            'B': self.fill_stroke, 'B*': self.fill_stroke_even_odd, 'b': self.close_fill_stroke,
+            'b*': self.close_fill_stroke_even_odd, 'n': self.end_path, 'W': self.set_clip, 'W*': self.set_clip_even_odd,
+            'BT': self.begin_text, 'ET': self.end_text, 'Tf': self.set_font, 'TL': self.set_leading,
+            'Tc': self.set_char_space, 'Tw': self.set_word_space, 'Tz': self.set_horizontal_scale,
+            'Ts': self.set_rise, 'Tr': self.set_render_mode, 'Td': self.move_text, 'TD': self.move_text_leading,
+            'Tm': self.set_text_matrix, 'T*': self.next_line, 'Tj': self.show, 'TJ': self.show_positioned,
+            "'": self.next_line_show, '"': self.next_line_show_spaced, 'Do': self.draw_xobject,
+        }
+
+    def run(self, content):
+        for operator, operands in _operations(content):
+            method = self.operators.get(operator)
+            # Operators that change nothing a preview shows, such as marked content, are skipped
+            if method is not None:
+                method(*operands)
+
+    def png(self):
+        output = io.BytesIO()
+        self.canvas.toPIL().save(output, 'PNG')
+        return output.getvalue()
+
+    def apply(self, matrix=None):
+        canvas = self.canvas
+        state = self.state
+        canvas.ctm = mmult(self.base, matrix or state.ctm)
+        canvas.setFillColor(state.fill)
+        canvas.setStrokeColor(state.stroke)
+        canvas.strokeWidth = state.line_width
+        canvas.lineCap = state.line_cap
+        canvas.lineJoin = state.line_join
+        canvas.dashArray = state.dash
+
+    # Graphics state
+
+    def save(self):
+        self.stack.append(self.state)
+        self.state = self.state.copy()
+
+    def restore(self):
+        clips = self.state.clips
+        self.state = self.stack.pop()
+        if self.state.clips != clips:
+            self.canvas.clipPathClear()
+            for clip in self.state.clips:
+                self.set_clip_path(*clip)
+
+    def transform(self, a, b, c, d, e, f):
+        self.state.ctm = mmult(self.state.ctm, (a, b, c, d, e, f))
+
+    def set_line_width(self, width):
+        self.state.line_width = width
+
+    def set_line_cap(self, cap):
+        self.state.line_cap = int(cap)
+
+    def set_line_join(self, join):
+        self.state.line_join = int(join)
+
+    def set_dash(self, array, phase):
+        self.state.dash = (phase, array) if array else None
+
+    def set_fill_gray(self, gray):
+        self.state.fill = Color(gray, gray, gray)
+
+    def set_stroke_gray(self, gray):
+        self.state.stroke = Color(gray, gray, gray)
+
+    def set_fill_rgb(self, red, green, blue):
+        self.state.fill = Color(red, green, blue)
+
+    def set_stroke_rgb(self, red, green, blue):
+        self.state.stroke = Color(red, green, blue)
+
+    def set_fill_cmyk(self, cyan, magenta, yellow, key):
+        self.state.fill = CMYKColor(cyan, magenta, yellow, key)
+
+    def set_stroke_cmyk(self, cyan, magenta, yellow, key):
+        self.state.stroke = CMYKColor(cyan, magenta, yellow, key)
+
+    # Paths, kept as segments in user space until a painting operator draws them
+
+    def move_to(self, x, y):
+        self.path.append(('moveTo', x, y))
+
+    def line_to(self, x, y):
+        self.path.append(('lineTo', x, y))
+
+    def curve_to(self, x1, y1, x2, y2, x3, y3):
+        self.path.append(('curveTo', x1, y1, x2, y2, x3, y3))
+
+    def curve_to_v(self, x2, y2, x3, y3):
+        x1, y1 = self.current_point()
+        self.curve_to(x1, y1, x2, y2, x3, y3)
+
+    def curve_to_y(self, x1, y1, x3, y3):
+        self.curve_to(x1, y1, x3, y3, x3, y3)
+
+    def current_point(self):
+        return self.path[-1][-2:] if self.path and self.path[-1][0] != 'pathClose' else (0, 0)
+
+    def close_path(self):
+        self.path.append(('pathClose',))
+
+    def rectangle(self, x, y, width, height):
+        self.path += [('moveTo', x, y), ('lineTo', x + width, y), ('lineTo', x + width, y + height),
+                      ('lineTo', x, y + height), ('pathClose',)]
+
+    def replay(self, path):
+        canvas = self.canvas
+        canvas.pathBegin()
+        for segment in path:
+            getattr(canvas, segment[0])(*segment[1:])
+
+    def paint(self, fill=None, stroke=False, close=False):
+        if close:
+            self.close_path()
+        if self.path and (fill is not None or stroke):
+            self.apply()
+            self.replay(self.path)
+            if fill is not None:
+                self.canvas.pathFill(fill)
+            if stroke:
+                self.canvas.pathStroke()
+        if self.clip is not None:
+            clip = (self.state.ctm, self.path, self.clip)
+            self.state.clips += (clip,)
+            self.set_clip_path(*clip)
+            self.clip = None
+        self.path = []
+
+    def stroke(self):
+        self.paint(stroke=True)
+
+    def close_stroke(self):
+        self.paint(stroke=True, close=True)
+
+    def fill(self):
+        self.paint(fill=FILL_NON_ZERO)
+
+    def fill_even_odd(self):
+        self.paint(fill=FILL_EVEN_ODD)
+
+    def fill_stroke(self):
+        self.paint(fill=FILL_NON_ZERO, stroke=True)
+
+    def fill_stroke_even_odd(self):
+        self.paint(fill=FILL_EVEN_ODD, stroke=True)
+
+    def close_fill_stroke(self):
+        self.paint(fill=FILL_NON_ZERO, stroke=True, close=True)
+
+    def close_fill_stroke_even_odd(self):
+        self.paint(fill=FILL_EVEN_ODD, stroke=True, close=True)
+
+    def end_path(self):
+        self.paint()
+
+    def set_clip(self):
+        self.clip = FILL_NON_ZERO
+
+    def set_clip_even_odd(self):
+        self.clip = FILL_EVEN_ODD
+
+    def set_clip_path(self, ctm, path, fill_mode):
+        self.canvas.ctm = mmult(self.base, ctm)
+        self.canvas.fillMode = fill_mode
+        self.replay(path)
+        self.canvas.clipPathSet()
+
+    # Text
+
+    def begin_text(self):
+        self.text_matrix = self.line_matrix = IDENTITY
+
+    def end_text(self):
+        pass
+
+    def set_font(self, name, size):
+        self.state.font = self.fonts[name]
+        self.state.font_size = size
+
+    def set_leading(self, leading):
+        self.state.leading = leading
+
+    def set_char_space(self, space):
+        self.state.char_space = space
+
+    def set_word_space(self, space):
+        self.state.word_space = space
+
+    def set_horizontal_scale(self, scale):
+        self.state.horizontal_scale = scale / 100
+
+    def set_rise(self, rise):
+        self.state.rise = rise
+
+    def set_render_mode(self, mode):
+        self.state.render_mode = int(mode)
+
+    def move_text(self, x, y):
+        self.text_matrix = self.line_matrix = mmult(self.line_matrix, (1, 0, 0, 1, x, y))
+
+    def move_text_leading(self, x, y):
+        self.state.leading = -y
+        self.move_text(x, y)
+
+    def set_text_matrix(self, a, b, c, d, e, f):
+        self.text_matrix = self.line_matrix = (a, b, c, d, e, f)
+
+    def next_line(self):
+        self.move_text(0, -self.state.leading)
+
+    def advance(self, width):
+        self.text_matrix = mmult(self.text_matrix, (1, 0, 0, 1, width * self.state.horizontal_scale, 0))
+
+    def show(self, string):
+        state = self.state
+        text = string.encode('latin-1').decode('cp1252', 'replace')
+        # Spacing applies after every character or space, so spaced text is drawn a piece at a time
+        pieces = list(text) if state.char_space or state.word_space else [text]
+        for piece in pieces:
+            if state.render_mode != 3:
+                self.apply(mmult(state.ctm, mmult(self.text_matrix, (state.horizontal_scale, 0, 0, 1, 0, state.rise))))
+                self.canvas.setFont(state.font, state.font_size)
+                self.canvas.drawString(0, 0, piece)
+            self.advance(stringWidth(piece, state.font, state.font_size) + state.char_space * len(piece)
+                         + state.word_space * piece.count(' '))
+
+    def show_positioned(self, items):
+        for item in items:
+            if isinstance(item, str):
+                self.show(item)
+            else:
+                self.advance(-item / 1000 * self.state.font_size)
+
+    def next_line_show(self, string):
+        self.next_line()
+        self.show(string)
+
+    def next_line_show_spaced(self, word_space, char_space, string):
+        self.state.word_space = word_space
+        self.state.char_space = char_space
+        self.next_line_show(string)
+
+    # XObjects
+
+    def draw_xobject(self, name):
+        xobject = self.document.idToObject[name]
+        if isinstance(xobject, PDFImageXObject):
+            # Images fill the unit square of their user space. renderPM draws a drawing from the page origin, so
+            # the image goes in a group carrying the current transformation.
+            drawing = Drawing(1, 1)
+            drawing.add(Group(ImageShape(0, 0, 1, 1, images.get(self.document, name)), transform=self.state.ctm))
+            renderPM.draw(drawing, self.canvas, 0, 0, showBoundary=False)
+            return
+        # Form XObjects draw in their own graphics state, clipped to their bounding box
+        self.save()
+        self.rectangle(xobject.lowerx, xobject.lowery, xobject.upperx - xobject.lowerx,
+                       xobject.uppery - xobject.lowery)
+        self.set_clip()
+        self.end_path()
+        self.run(xobject.stream)
+        self.restore()
+
+
+def rasterize(pdf_canvas, page=1, dpi=PREVIEW_DPI):
+    # PNG of one page already shown on a reportlab canvas, numbered from 1
+    pages = pdf_canvas._doc.Pages.pages
+    if not 1 <= page <= len(pages):
+        raise ValueError('The document has {:} pages, not {:}'.format(len(pages), page))
+    pdf_page = pages[page - 1]
+    rasterizer = PageRasterizer(pdf_canvas._doc, pdf_page.pagewidth, pdf_page.pageheight, dpi)
+    rasterizer.run(pdf_page.stream)
+    return rasterizer.png()
+
+
+def preview(template_class, data, dpi=PREVIEW_DPI, page=1, **options):
+    # options are the template's, such as compiled or signature_store
+    template = template_class(response_type='bytes', **options)
+    with render_scope():
+        template.render(data)
+        template.canvas.showPage()
+        with phase('rasterize'):
+            return rasterize(template.canvas, page, dpi)
+
+
+class PreviewTemplate:
+    # Writes a preview where a template would write the PDF, so batch renders can produce previews as they are
+
+    def __init__(self, template_class, dpi=PREVIEW_DPI, page=1, response_type='file', filename='preview.png',
+                 stream=None, **options):
+        self.template_class = template_class
+        self.dpi = dpi
+        self.page = page
+        self.response_type = response_type
+        self.filename = filename
+        self.stream = stream
+        self.options = options
+
+    def generate(self, data):
+        png = preview(self.template_class, data, self.dpi, self.page, **self.options)
+        if self.response_type == 'file':
+            with open(self.filename, 'wb') as f:
+                f.write(png)
+            return None
+        if self.stream is None:
+            return png
+        write = getattr(self.stream, 'write', None) or self.stream.sendall
+        write(png)
+        return None
+
+
+def iter_preview_batch(template_class, payloads, dpi=PREVIEW_DPI, page=1, filename_pattern='preview-{index:05d}.png',
+                       **kwargs):
+    # A per-record batch of previews in worker processes, taking the options of iter_render_batch
+    return iter_render_batch(functools.partial(PreviewTemplate, template_class, dpi, page), payloads,
+                             mode=PER_RECORD, filename_pattern=filename_pattern, **kwargs)
+
+
+class PreviewCache(RenderCache):
+    # Thumbnails on local disk, keyed like cached PDFs with the resolution and page added
+
+    suffix = '.png'
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        super().__init__(directory, max_bytes)
+
+    def render(self, template_class, data, dpi=THUMBNAIL_DPI, page=1, **options):
+        with phase('preview_cache'):
+            key = self.key(template_class, data, dict(options, dpi=dpi, page=page))
+            png = None if key is None else self.get(key)
+        if png is not None:
+            count('preview_cache_hits')
+            return png
+        count('preview_cache_misses')
+        png = preview(template_class, data, dpi, page, **options)
+        if key is not None:
+            self.put(key, png)
+        return png
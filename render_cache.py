@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal
+
+import reportlab
+
+from instrumentation import count, phase
+from output_profiles import OutputProfile
+from signatures import image_digest
+
+SUFFIX = '.pdf'
+
+
+def _encode(value):
+    if isinstance(value, (date, Decimal)):
+        return str(value)
+    # Iterators such as streamed fuel form trips can only be read once, so those payloads are not cached
+    raise TypeError('{:} is not cacheable'.format(value.__class__.__name__))
+
+
+def _encode_option(value):
+    # Profiles are keyed by their settings, so equal profiles built separately share entries
+    if isinstance(value, OutputProfile):
+        return [value.name, value.level, value.ascii85, value.image_level, value.jpeg_quality]
+    raise TypeError('{:} is not cacheable'.format(value.__class__.__name__))
+
+
+class RenderCache:
+    # PDFs on local disk keyed by a hash of everything that decides their bytes, evicted least recently used first
+
+    suffix = SUFFIX
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        # Files left by earlier processes, oldest access first
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith(self.suffix):
+                stat = os.stat(os.path.join(directory, name))
+                files.append((stat.st_mtime_ns, name[:-len(self.suffix)], stat.st_size))
+        self.entries = OrderedDict((key, size) for mtime, key, size in sorted(files))
+        self.size = sum(self.entries.values())
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    @staticmethod
+    def key(template_class, data, options=None):
+        try:
+            payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=_encode)
+            # Renders with options that cannot be keyed bypass the cache rather than fail
+            options_key = json.dumps(options or {}, sort_keys=True, default=_encode_option)
+        except TypeError:
+            return None
+        digest = hashlib.sha256()
+        digest.update('{:}\0{:}\0{:}\0'.format(template_class.__name__, template_class.version,
+                                                reportlab.Version).encode())
+        digest.update(options_key.encode())
+        digest.update(payload.encode())
+        for path in template_class.image_paths(data):
+            digest.update(image_digest(path, (options or {}).get('signature_store')).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                pdf = f.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.size -= self.entries.pop(key, 0)
+                self.misses += 1
+            return None
+        # The modification time records the last access, so the eviction order survives restarts
+        os.utime(path)
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = len(pdf)
+                self.size += len(pdf)
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return pdf
+
+    def put(self, key, pdf):
+        # Written under a temporary name and renamed, so readers never see a partial file
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf)
+        os.replace(temporary, self.path(key))
+        evicted = []
+        with self.lock:
+            self.size += len(pdf) - self.entries.pop(key, 0)
+            self.entries[key] = len(pdf)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.size -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self.path(old_key))
+            except FileNotFoundError:
+                pass
+
+    def render(self, template_class, data, **options):
+        # Cached renders are always invariant, so the same request gives the same bytes whether cached or not
+        if not options.pop('invariant', True):
+            raise ValueError('Renders through the cache are always invariant')
+        with phase('render_cache'):
+            key = self.key(template_class, data, options)
+            pdf = None if key is None else self.get(key)
+        if pdf is not None:
+            count('render_cache_hits')
+            return pdf
+        count('render_cache_misses')
+        pdf = template_class(response_type='bytes', invariant=True, **options).generate(data)
+        if key is not None:
+            self.put(key, pdf)
+        return pdf
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries), 'bytes': self.size}
+
+    def clear(self):
+        with self.lock:
+            keys = list(self.entries)
+            self.entries.clear()
+            self.size = 0
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,132 @@
+import hashlib
+import heapq
+import json
+import os
+import shutil
+
+from batch import record_key
+from ingest import render_records
+
+# A manifest is a JSON object describing one job, shared unchanged by every node that renders a shard of it
+MANIFEST_DEFAULTS = {'format': None, 'key': None, 'filename_pattern': 'record-{index:05d}.pdf', 'template_options': {}}
+MANIFEST_REQUIRED = ('template', 'input', 'output_dir', 'shards')
+INDEX = 'index.jsonl'
+JOURNAL = 'journal.jsonl'
+
+
+def read_manifest(path):
+    with open(path, encoding='utf-8') as f:
+        manifest = dict(MANIFEST_DEFAULTS, **json.load(f))
+    missing = [name for name in MANIFEST_REQUIRED if name not in manifest]
+    if missing:
+        raise ValueError('{:} is missing {:}'.format(path, ', '.join(missing)))
+    if not isinstance(manifest['shards'], int) or manifest['shards'] < 1:
+        raise ValueError('{:}: shards must be a positive integer'.format(path))
+    return manifest
+
+
+def shard_of(key, shards):
+    # A stable hash, unlike hash(), so every node agrees on the partition of every key
+    return int.from_bytes(hashlib.sha256(str(key).encode()).digest()[:8], 'big') % shards
+
+
+def shard_dir(manifest, shard):
+    return os.path.join(manifest['output_dir'], 'shard-{:}-of-{:}'.format(shard, manifest['shards']))
+
+
+def _file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def render_shard(template_class, manifest, shard, on_error=None, workers=None):
+    # Renders the records whose key falls in this shard into its own directory, then writes the shard index. The
+    # index is only renamed into place once the shard finished, so merge never picks up a shard still running.
+    shards = manifest['shards']
+    if not 0 <= shard < shards:
+        raise ValueError('shard must be between 0 and {:}'.format(shards - 1))
+    directory = shard_dir(manifest, shard)
+    keys = {}
+
+    def select(index, payload):
+        key = record_key(payload, index, manifest['key'])
+        if shard_of(key, shards) != shard:
+            return False
+        keys[index] = key
+        return True
+
+    # Invalid lines never get a record index, so they are listed at the end of the index for merge to refuse
+    invalid = []
+
+    def skip_invalid(line_number, error):
+        invalid.append(line_number)
+        on_error(line_number, error)
+
+    results = render_records(template_class, manifest['input'], format=manifest['format'],
+                             on_error=None if on_error is None else skip_invalid,
+                             output_dir=directory, filename_pattern=manifest['filename_pattern'], workers=workers,
+                             template_options=manifest['template_options'], journal=os.path.join(directory, JOURNAL),
+                             select=select)
+    os.makedirs(directory, exist_ok=True)
+    index_path = os.path.join(directory, INDEX)
+    partial = index_path + '.part'
+    with open(partial, 'w', encoding='utf-8') as index_file:
+        for result in results:
+            entry = {'index': result.index, 'key': keys.pop(result.index), 'shard': shard}
+            if result.error is None:
+                entry.update(filename=os.path.relpath(result.filename, manifest['output_dir']),
+                             size=os.path.getsize(result.filename), sha256=_file_digest(result.filename))
+            else:
+                entry['error'] = True
+            index_file.write(json.dumps(entry, default=str) + '\n')
+            yield result
+        for line_number in invalid:
+            index_file.write(json.dumps({'line': line_number, 'shard': shard, 'invalid': True}) + '\n')
+    os.replace(partial, index_path)
+
+
+def _read_index(path, input_path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry.get('invalid'):
+                raise ValueError('Line {:} of {:} is invalid and was skipped by shard {:}'.format(
+                    entry['line'], input_path, entry['shard']))
+            yield entry
+
+
+def merge(manifest, destination=None):
+    # Combines the shard indexes in record order, reading each one as a stream. With a destination the PDFs are
+    # also copied there, so the deliverable is one directory with a single index.
+    paths = [os.path.join(shard_dir(manifest, shard), INDEX) for shard in range(manifest['shards'])]
+    missing = [path for path in paths if not os.path.isfile(path)]
+    if missing:
+        raise ValueError('Shards not finished: {:}'.format(', '.join(missing)))
+    if destination is not None:
+        os.makedirs(destination, exist_ok=True)
+    index_path = os.path.join(destination or manifest['output_dir'], INDEX)
+    partial = index_path + '.part'
+    records = 0
+    previous = None
+    try:
+        with open(partial, 'w', encoding='utf-8') as index_file:
+            for entry in heapq.merge(*[_read_index(path, manifest['input']) for path in paths], key=lambda entry: entry['index']):
+                if entry['index'] == previous:
+                    raise ValueError('Record {:} appears in more than one shard'.format(entry['index']))
+                if entry.get('error'):
+                    raise ValueError('Record {:} failed in shard {:}'.format(entry['index'], entry['shard']))
+                previous = entry['index']
+                if destination is not None:
+                    source = os.path.join(manifest['output_dir'], entry['filename'])
+                    entry['filename'] = os.path.basename(source)
+                    shutil.copyfile(source, os.path.join(destination, entry['filename']))
+                index_file.write(json.dumps(entry) + '\n')
+                records += 1
+        os.replace(partial, index_path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return records
@@ -0,0 +1,237 @@
+import hashlib
+import io
+import json
+import math
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+from reportlab.lib.units import inch
+
+from assets import Asset, get_asset
+from instrumentation import count, phase
+
+# Signatures are drawn half an inch wide, pixels beyond this resolution at that size are never seen
+SIGNATURE_WIDTH = .5 * inch
+SIGNATURE_DPI = 200
+# Lighter pixels count as paper when cropping the margins around the ink
+INK_THRESHOLD = 235
+# Space kept around the ink, as a fraction of the cropped width
+CROP_MARGIN = 0.04
+
+
+def normalize(data, width=SIGNATURE_WIDTH, dpi=SIGNATURE_DPI, bilevel=False):
+    # Crops the paper around the ink, downsamples to dpi at the drawn width and stores grayscale, or 1-bit when
+    # bilevel. Transparency is kept as an alpha channel, except in 1-bit images, which are flattened onto white.
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    if image.mode in ('P', 'PA'):
+        image = image.convert('RGBA')
+    alpha = image.getchannel('A') if image.mode in ('RGBA', 'LA') else None
+    if alpha is not None and alpha.getextrema()[0] == 255:
+        alpha = None
+    if alpha is not None:
+        gray = Image.new('L', image.size, 255)
+        gray.paste(image.convert('L'), mask=alpha)
+    else:
+        gray = image.convert('L')
+    box = gray.point(lambda value: 255 if value < INK_THRESHOLD else 0).getbbox()
+    if box is not None:
+        margin = math.ceil((box[2] - box[0]) * CROP_MARGIN)
+        box = (max(box[0] - margin, 0), max(box[1] - margin, 0), min(box[2] + margin, image.width),
+               min(box[3] + margin, image.height))
+        gray = gray.crop(box)
+        alpha = alpha.crop(box) if alpha is not None else None
+    target = math.ceil(width / inch * dpi)
+    if gray.width > target:
+        size = (target, max(1, round(gray.height * target / gray.width)))
+        gray = gray.resize(size, Image.LANCZOS)
+        alpha = alpha.resize(size, Image.LANCZOS) if alpha is not None else None
+    if bilevel:
+        result = gray.point(lambda value: 255 if value >= 128 else 0, '1')
+    elif alpha is not None:
+        result = Image.merge('LA', (gray, alpha))
+    else:
+        result = gray
+    output = io.BytesIO()
+    result.save(output, 'PNG')
+    return output.getvalue()
+
+
+class SignatureCache:
+    # Normalized signatures keyed by the content hash of the original, so renamed or copied files share an entry
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, width=SIGNATURE_WIDTH, dpi=SIGNATURE_DPI, bilevel=False):
+        original = get_asset(path)
+        key = (original.digest, width, dpi, bilevel)
+        with self.lock:
+            asset = self.entries.get(key)
+            if asset is not None:
+                self.entries.move_to_end(key)
+        if asset is not None:
+            count('signatures_cached')
+            return asset
+        with phase('normalize_signature'):
+            asset = Asset(path, normalize(original.data, width, dpi, bilevel), original.mtime)
+        with self.lock:
+            self.entries[key] = asset
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        count('signatures_normalized')
+        return asset
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+cache = SignatureCache()
+
+DATA = 'signatures.dat'
+INDEX = 'signatures.idx'
+
+
+class SignatureStore:
+    # Normalized signatures packed into one memory-mapped data file, found by employee ID or name through an
+    # append-only JSON lines index. Lookups slice the map without copying, and a single writer may append while
+    # any number of processes read.
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.data_path = os.path.join(directory, DATA)
+        self.index_path = os.path.join(directory, INDEX)
+        os.makedirs(directory, exist_ok=True)
+        for path in (self.data_path, self.index_path):
+            open(path, 'ab').close()
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.names = {}
+        self.assets = {}
+        self.map = None
+        self.index_read = 0
+        self.refresh()
+
+    def refresh(self):
+        # Picks up entries appended since the last call, by this or another process
+        with self.lock:
+            if os.path.getsize(self.index_path) == self.index_read:
+                return
+            size = os.path.getsize(self.data_path)
+            if size and (self.map is None or len(self.map) < size):
+                with open(self.data_path, 'rb') as f:
+                    self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            with open(self.index_path, 'rb') as f:
+                f.seek(self.index_read)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # An append still being written, read it next time
+                        break
+                    self.index_read += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry['offset'] + entry['length'] > size:
+                        continue
+                    self.entries[entry['id']] = entry
+                    if entry.get('name'):
+                        self.names[entry['name']] = entry['id']
+
+    def entry(self, key):
+        key = self.names.get(key, key)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.refresh()
+            entry = self.entries.get(self.names.get(key, key))
+        return entry
+
+    def __contains__(self, key):
+        return self.entry(key) is not None
+
+    def get(self, key):
+        # The stored PNG as a view of the mapped file
+        entry = self.entry(key)
+        if entry is None:
+            raise KeyError(key)
+        return memoryview(self.map)[entry['offset']:entry['offset'] + entry['length']]
+
+    def digest(self, key):
+        return self.entry(key)['digest']
+
+    def asset(self, key):
+        entry = self.entry(key)
+        if entry is None:
+            raise KeyError(key)
+        with self.lock:
+            asset = self.assets.get(entry['digest'])
+        if asset is None:
+            view = self.get(key)
+            asset = Asset(entry['id'], bytes(view))
+            view.release()
+            with self.lock:
+                self.assets[entry['digest']] = asset
+        return asset
+
+    def add(self, employee_id, path, name=None):
+        self.extend([(employee_id, path, name)])
+
+    def extend(self, signatures):
+        # Bulk appends (employee ID, image path, name) triples, normalizing each image. The data reaches the disk
+        # before the index lines that point at it, so a crash can only leave unreferenced bytes behind.
+        entries = []
+        with open(self.data_path, 'ab') as data:
+            for employee_id, path, name in signatures:
+                with open(path, 'rb') as f:
+                    normalized = normalize(f.read())
+                entries.append({'id': str(employee_id), 'name': name, 'offset': data.tell(),
+                                'length': len(normalized), 'digest': hashlib.md5(normalized).hexdigest()})
+                data.write(normalized)
+            data.flush()
+            os.fsync(data.fileno())
+        with open(self.index_path, 'a', encoding='utf-8') as index:
+            for entry in entries:
+                index.write(json.dumps(entry) + '\n')
+        self.refresh()
+        return len(entries)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(directory):
+    # One open store per directory and process, shared by every template that names it
+    key = os.path.abspath(directory)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = SignatureStore(directory)
+        return _stores[key]
+
+
+def get_signature(path, store=None):
+    # path is an image file or, when a store directory is given, the employee ID or name of a packed signature
+    if store is not None:
+        packed = open_store(store)
+        if path in packed:
+            return packed.asset(path)
+    return cache.get(path)
+
+
+def image_digest(path, store=None):
+    if store is not None:
+        packed = open_store(store)
+        if path in packed:
+            return packed.digest(path)
+    return get_asset(path).digest
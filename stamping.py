@@ -0,0 +1,265 @@
+import io
+import re
+import zlib
+
+from PIL import Image
+
+from signatures import get_signature
+
+# Adds signatures and dates to a rendered fuel card form as a PDF incremental update. The original bytes are kept
+# as they are and the update appends the signature images, a content stream drawing them at the positions in the
+# template's layout map, new versions of the pages they go on and a cross-reference section pointing at them.
+
+TOKEN = re.compile(rb'(?:\s|%[^\r\n]*)*(<<|>>|\[|\]|\((?:\\.|[^\\()])*\)|<[0-9A-Fa-f\s]*>|/[^\s/<>\[\]()%]*'
+                   rb'|[^\s/<>\[\]()%]+)', re.S)
+OBJECT = re.compile(rb'\s*(\d+)\s+(\d+)\s+obj')
+XREF_SECTION = re.compile(rb'\s*(\d+)\s+(\d+)\s*')
+XREF_ENTRY = re.compile(rb'(\d{10}) (\d{5}) ([nf])')
+NUMBER = re.compile(rb'[+-]?(\d+\.?\d*|\.\d+)$')
+
+
+class Name(str):
+    pass
+
+
+class Ref:
+
+    def __init__(self, number, generation=0):
+        self.number = number
+        self.generation = generation
+
+
+class Raw(bytes):
+    # Strings, booleans and other values that are copied through unchanged
+    pass
+
+
+def _token(data, position):
+    match = TOKEN.match(data, position)
+    if match is None:
+        raise ValueError('Unreadable PDF object at byte {:}'.format(position))
+    return match.group(1), match.end()
+
+
+def _parse(data, position):
+    token, position = _token(data, position)
+    if token == b'<<':
+        value = {}
+        while True:
+            key, after = _token(data, position)
+            if key == b'>>':
+                return value, after
+            key, position = _parse(data, position)
+            value[key], position = _parse(data, position)
+    if token == b'[':
+        value = []
+        while True:
+            item, after = _token(data, position)
+            if item == b']':
+                return value, after
+            item, position = _parse(data, position)
+            value.append(item)
+    if token.startswith(b'/'):
+        return Name(token[1:].decode('latin-1')), position
+    if NUMBER.match(token):
+        if b'.' in token:
+            return float(token), position
+        # An integer may be the object number of an indirect reference, 12 0 R
+        generation, after = _token(data, position)
+        if generation.isdigit():
+            keyword, end = _token(data, after)
+            if keyword == b'R':
+                return Ref(int(token), int(generation)), end
+        return int(token), position
+    return Raw(token), position
+
+
+def _serialize(value):
+    if isinstance(value, dict):
+        return b'<< ' + b' '.join(_serialize(Name(key)) + b' ' + _serialize(item)
+                                  for key, item in value.items()) + b' >>'
+    if isinstance(value, list):
+        return b'[ ' + b' '.join(_serialize(item) for item in value) + b' ]'
+    if isinstance(value, Name):
+        return b'/' + value.encode('latin-1')
+    if isinstance(value, Ref):
+        return '{:} {:} R'.format(value.number, value.generation).encode()
+    if isinstance(value, Raw):
+        return bytes(value)
+    return str(value).encode()
+
+
+class PdfFile:
+    # Just enough of a reader to find the pages of a document written with classic cross-reference tables
+
+    def __init__(self, data):
+        self.data = data
+        self.offsets = {}
+        start = data.rindex(b'startxref')
+        self.startxref = int(_token(data, start + len(b'startxref'))[0])
+        self.trailer = None
+        position = self.startxref
+        while position is not None:
+            trailer = self.read_xref(position)
+            self.trailer = self.trailer or trailer
+            position = trailer.get('Prev')
+
+    def read_xref(self, position):
+        if not self.data.startswith(b'xref', position):
+            raise ValueError('Cross-reference streams are not supported')
+        position += len(b'xref')
+        while True:
+            section = XREF_SECTION.match(self.data, position)
+            if section is None:
+                break
+            first, count = int(section.group(1)), int(section.group(2))
+            position = section.end()
+            for number in range(first, first + count):
+                entry = XREF_ENTRY.match(self.data, position)
+                if entry is None:
+                    raise ValueError('Broken cross-reference entry at byte {:}'.format(position))
+                position = entry.end()
+                while self.data[position:position + 1] in (b' ', b'\r', b'\n'):
+                    position += 1
+                # Later sections come first, so they win over the older entries they replace
+                if entry.group(3) == b'n':
+                    self.offsets.setdefault(number, int(entry.group(1)))
+        keyword, position = _token(self.data, position)
+        if keyword != b'trailer':
+            raise ValueError('Missing trailer at byte {:}'.format(position))
+        return _parse(self.data, position)[0]
+
+    def object(self, value):
+        if not isinstance(value, Ref):
+            return value
+        match = OBJECT.match(self.data, self.offsets[value.number])
+        if match is None or int(match.group(1)) != value.number:
+            raise ValueError('Object {:} is not at its cross-reference offset'.format(value.number))
+        return _parse(self.data, match.end())[0]
+
+    def pages(self, node=None):
+        # (reference, dictionary) for every page in document order
+        if node is None:
+            node = self.object(self.trailer['Root'])['Pages']
+        pages = []
+        for kid in self.object(node)['Kids']:
+            page = self.object(kid)
+            if page.get('Type') == 'Pages':
+                pages.extend(self.pages(kid))
+            else:
+                pages.append((kid, page))
+        return pages
+
+
+def _stream(dictionary, content):
+    dictionary = dict(dictionary, Length=len(content))
+    return _serialize(dictionary) + b'\nstream\n' + content + b'\nendstream'
+
+
+def _image_objects(path, number, signature_store):
+    # The signature as a Flate image XObject, with its alpha channel as a soft mask when it has one
+    image = Image.open(io.BytesIO(get_signature(path, signature_store).data))
+    if image.mode == 'P':
+        image = image.convert('RGBA')
+    alpha = image.getchannel('A') if image.mode in ('RGBA', 'LA') else None
+    if alpha is not None and alpha.getextrema()[0] == 255:
+        alpha = None
+    gray = image.mode in ('1', 'L', 'LA')
+    pixels = image.convert('L' if gray else 'RGB')
+    image_dictionary = {'Type': Name('XObject'), 'Subtype': Name('Image'), 'Width': image.width,
+                        'Height': image.height, 'ColorSpace': Name('DeviceGray' if gray else 'DeviceRGB'),
+                        'BitsPerComponent': 8, 'Filter': Name('FlateDecode')}
+    objects = []
+    if alpha is not None:
+        image_dictionary['SMask'] = Ref(number + 1)
+        objects.append((number + 1, _stream(dict(image_dictionary, ColorSpace=Name('DeviceGray')),
+                                            zlib.compress(alpha.tobytes()))))
+    objects.insert(0, (number, _stream(image_dictionary, zlib.compress(pixels.tobytes()))))
+    return image.width, image.height, objects
+
+
+def _text(value):
+    return value.encode('cp1252').replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def stamp(pdf, layout, signatures, signature_store=None):
+    # signatures maps layout slots such as approval.checked to a dict with a signature, a date or both. Signatures
+    # are image paths or, with a signature_store directory, employee IDs or names as in the templates.
+    document = PdfFile(pdf)
+    pages = document.pages()
+    number = document.trailer['Size']
+    objects = []
+    # base font name -> resource name and object number, dates are set in the font recorded in the layout
+    fonts = {}
+    # page index -> (content operators, XObject resources)
+    updates = {}
+    for slot, values in signatures.items():
+        if slot not in layout:
+            raise ValueError('No {:} in the layout map'.format(slot))
+        entry = layout[slot]
+        content, images = updates.setdefault(entry['page'] - 1, ([], {}))
+        if values.get('signature'):
+            x, y, width, height = entry['signature']
+            image_width, image_height, image_objects = _image_objects(values['signature'], number, signature_store)
+            # Fit the signature into the slot the form left for it, keeping its aspect ratio
+            scale = min(width / image_width, height / image_height)
+            name = 'Stamp{:}'.format(number)
+            images[name] = Ref(number)
+            content.append('q {:.4f} 0 0 {:.4f} {:.4f} {:.4f} cm /{:} Do Q'.format(
+                image_width * scale, image_height * scale, x, y, name).encode())
+            objects.extend(image_objects)
+            number += len(image_objects)
+        if values.get('date'):
+            font_name, font_size = entry['font']
+            if font_name not in fonts:
+                fonts[font_name] = ('Stamp{:}'.format(number), number)
+                objects.append((number, _serialize({'Type': Name('Font'), 'Subtype': Name('Type1'),
+                                                    'BaseFont': Name(font_name),
+                                                    'Encoding': Name('WinAnsiEncoding')})))
+                number += 1
+            x, y = entry['date']
+            content.append('BT /{:} {:} Tf {:.4f} {:.4f} Td ('.format(fonts[font_name][0], font_size, x, y).encode()
+                           + _text(values['date']) + b') Tj ET')
+    # Saves the graphics state ahead of the page's own content, so the stamp is drawn in default user space
+    opening = number
+    objects.append((opening, _stream({}, b'q')))
+    number += 1
+    for index, (content, images) in sorted(updates.items()):
+        reference, page = pages[index]
+        page = dict(page)
+        resources = dict(document.object(page.get('Resources', {})))
+        if images:
+            resources['XObject'] = dict(document.object(resources.get('XObject', {})), **images)
+        if fonts:
+            resources['Font'] = dict(document.object(resources.get('Font', {})),
+                                     **{name: Ref(font) for name, font in fonts.values()})
+        page['Resources'] = resources
+        contents = page.get('Contents', [])
+        contents = contents if isinstance(contents, list) else [contents]
+        page['Contents'] = [Ref(opening)] + contents + [Ref(number)]
+        objects.append((number, _stream({}, b'Q\n' + b'\n'.join(content))))
+        objects.append((reference.number, _serialize(page)))
+        number += 1
+
+    output = io.BytesIO()
+    output.write(pdf if pdf.endswith(b'\n') else pdf + b'\n')
+    offsets = {}
+    for object_number, body in objects:
+        offsets[object_number] = output.tell()
+        output.write(b'%d 0 obj\n%s\nendobj\n' % (object_number, body))
+    startxref = output.tell()
+    output.write(b'xref\n')
+    numbers = sorted(offsets)
+    while numbers:
+        # One subsection for every run of consecutive object numbers
+        run = 1
+        while run < len(numbers) and numbers[run] == numbers[0] + run:
+            run += 1
+        output.write(b'%d %d\n' % (numbers[0], run))
+        for object_number in numbers[:run]:
+            output.write(b'%010d 00000 n \n' % offsets[object_number])
+        numbers = numbers[run:]
+    trailer = {key: value for key, value in document.trailer.items() if key not in ('Prev', 'XRefStm')}
+    trailer.update(Size=number, Prev=document.startxref)
+    output.write(b'trailer\n%s\nstartxref\n%d\n%%%%EOF\n' % (_serialize(trailer), startxref))
+    return output.getvalue()
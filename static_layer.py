@@ -0,0 +1,66 @@
+import copy
+import threading
+
+from reportlab.platypus import Flowable, Spacer
+
+# Form XObjects clip to their bounding box, so leave room for line widths drawn on the edges
+FORM_MARGIN = 10
+
+_static_flowables = {}
+# Held while a shared flowable draws itself into a form, since drawing sets its canvas
+_recording = threading.Lock()
+
+
+def draw_static(pdf_canvas, name, draw):
+    # Record the drawing once per document as a form XObject and replay it on every page
+    if not pdf_canvas.hasForm(name):
+        pdf_canvas.beginForm(name)
+        draw()
+        pdf_canvas.endForm()
+    pdf_canvas.doForm(name)
+
+
+class StaticFlowable(Flowable):
+
+    def __init__(self, name, flowable, avail_width, avail_height):
+        super().__init__()
+        self.name = name
+        self.flowable = flowable
+        self.hAlign = getattr(flowable, 'hAlign', 'LEFT')
+        # Layout happens once here instead of on every render
+        self.width, self.height = flowable.wrap(avail_width, avail_height)
+
+    def wrap(self, avail_width, avail_height):
+        return self.width, self.height
+
+    def getSpaceBefore(self):
+        return self.flowable.getSpaceBefore()
+
+    def getSpaceAfter(self):
+        return self.flowable.getSpaceAfter()
+
+    def draw(self):
+        if not self.canv.hasForm(self.name):
+            self.canv.beginForm(self.name, -FORM_MARGIN, -FORM_MARGIN, self.width + FORM_MARGIN,
+                                self.height + FORM_MARGIN)
+            with _recording:
+                self.flowable.drawOn(self.canv, 0, 0)
+            self.canv.endForm()
+        self.canv.doForm(self.name)
+
+
+def static_flowables(name, build, avail_width, avail_height):
+    # Constant flowables are built and wrapped once per process for each available width. Spacers draw nothing and
+    # are kept as they are. Every render gets copies, as drawing sets the canvas on a flowable.
+    key = (name, avail_width, avail_height)
+    flowables = _static_flowables.get(key)
+    if flowables is None:
+        flowables = []
+        index = 0
+        for flowable in build():
+            if not isinstance(flowable, Spacer):
+                flowable = StaticFlowable('{:}{:}'.format(name, index), flowable, avail_width, avail_height)
+                index += 1
+            flowables.append(flowable)
+        flowables = _static_flowables.setdefault(key, flowables)
+    return [copy.copy(flowable) for flowable in flowables]
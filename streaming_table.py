@@ -0,0 +1,65 @@
+from collections import deque
+
+from reportlab.platypus import Flowable
+
+
+class StreamingTable(Flowable):
+    # Pulls rows from an iterator one frame at a time, so only the rows of the page being laid out are held.
+    # build(rows, last) returns the table for a page, with the repeated header and, on the last page, the footer.
+    hAlign = 'CENTER'
+
+    def __init__(self, rows, build, pending=()):
+        super().__init__()
+        self.rows = rows
+        self.build = build
+        # Rows pulled from the iterator but not yet placed, with their measured heights
+        self.pending = deque(pending)
+        self.ended = False
+        self.table = None
+
+    def measure(self, availWidth, availHeight):
+        # Rows of a grid have independent heights, so each row is measured once on its own against the header.
+        # Rows are pulled only until they overrun availHeight or run out.
+        header = self.build([], False).wrap(availWidth, availHeight)[1]
+        used = header + sum(height for row, height in self.pending)
+        while not self.ended and used <= availHeight:
+            row = next(self.rows, None)
+            if row is None:
+                self.ended = True
+                break
+            height = self.build([row], False).wrap(availWidth, availHeight)[1] - header
+            self.pending.append((row, height))
+            used += height
+        return header
+
+    def wrap(self, availWidth, availHeight):
+        self.measure(availWidth, availHeight)
+        if self.ended:
+            if self.table is None:
+                self.table = self.build([row for row, height in self.pending], True)
+            self.width, self.height = self.table.wrap(availWidth, availHeight)
+        else:
+            # More rows than fit: reporting more than the available height makes the frame split it into tables
+            self.width, self.height = availWidth, availHeight + 1
+        return self.width, self.height
+
+    def draw(self):
+        self.table.drawOn(self.canv, 0, 0)
+
+    def split(self, availWidth, availHeight):
+        used = self.measure(availWidth, availHeight)
+        chunk = []
+        while self.pending and used + self.pending[0][1] <= availHeight:
+            row, height = self.pending.popleft()
+            chunk.append(row)
+            used += height
+        if self.ended and not self.pending:
+            # The footer moves to the next page on its own when it does not fit under the last rows
+            table = self.build(chunk, True)
+            if table.wrap(availWidth, availHeight)[1] <= availHeight:
+                return [table]
+        if not chunk:
+            return []
+        rest = StreamingTable(self.rows, self.build, self.pending)
+        rest.ended = self.ended
+        return [self.build(chunk, False), rest]
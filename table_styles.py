@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+
+from reportlab.platypus import Table, TableStyle
+from reportlab.platypus.tables import LINECOMMANDS
+
+# Commands kept as lists on the table rather than resolved onto individual cells
+TABLE_COMMANDS = ('BACKGROUND', 'ROWBACKGROUNDS', 'COLBACKGROUNDS', 'SPAN', 'NOSPLIT', 'ROUNDEDCORNERS')
+
+class CompiledTable(Table):
+    compiled = None
+    measured_width = None
+
+    def _calc(self, availWidth, availHeight):
+        # Row heights do not depend on the available height, so measuring for a fit check, layout and splitting
+        # wraps the cells once per width
+        if availWidth != self.measured_width:
+            super()._calc(availWidth, availHeight)
+            self.measured_width = availWidth
+
+    def _calcSpanRanges(self):
+        # Split tables are rebuilt through this class with other shapes, so fall back when the grid differs
+        compiled = self.compiled
+        if (compiled is None or (self._nrows, self._ncols) != compiled.shape
+                or self._spanCmds != compiled.span_commands):
+            return super()._calcSpanRanges()
+        self._spanRanges = compiled.span_ranges
+        self._colSpanCells = compiled.col_span_cells
+        self._rowSpanCells = compiled.row_span_cells
+
+
+class CompiledTableStyle:
+
+    def __init__(self, commands, nrows, ncols, col_widths):
+        self.shape = (nrows, ncols)
+        self.col_widths = col_widths
+        self.table_style = TableStyle([command for command in commands
+                                       if command[0] in TABLE_COMMANDS or command[0] in LINECOMMANDS])
+        # Resolve per-cell styles and span ranges once on an empty table of the same shape
+        probe = Table([[''] * ncols for _ in range(nrows)], colWidths=col_widths, style=commands)
+        self.cell_styles = probe._cellStyles
+        self.span_commands = probe._spanCmds
+        probe._calcSpanRanges()
+        self.span_ranges = probe._spanRanges
+        self.col_span_cells = probe._colSpanCells
+        self.row_span_cells = probe._rowSpanCells
+
+    def table(self, data, heights=None):
+        t = CompiledTable(data, colWidths=list(self.col_widths), rowHeights=heights and list(heights),
+                          cellStyles=self.cell_styles)
+        t.setStyle(self.table_style)
+        t.compiled = self
+        return t
+
+
+class CompiledStyles:
+    # Tables with a variable number of rows, such as trips and gate pass reasons, compile a style for every row
+    # count they come in, so the least recently used are dropped beyond max_entries
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, commands, col_widths):
+        with self.lock:
+            compiled = self.entries.get(key)
+            if compiled is not None:
+                self.entries.move_to_end(key)
+                return compiled
+        compiled = CompiledTableStyle(commands, key[1], key[2], col_widths)
+        with self.lock:
+            self.entries[key] = compiled
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+compiled_styles = CompiledStyles()
+
+
+def compiled_table(name, data, commands, frame_width, ratios=None, heights=None):
+    # Styles and column widths are compiled once per table name, shape and frame width, i.e. per page size. Row
+    # heights left as None follow the cells.
+    nrows, ncols = len(data), max(len(row) for row in data)
+    column_width = frame_width / ncols
+    col_widths = [column_width * ratio for ratio in (ratios or [1] * ncols)]
+    return compiled_styles.get((name, nrows, ncols, frame_width), commands, col_widths).table(data, heights)
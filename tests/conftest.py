@@ -0,0 +1,29 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    # Templates load their logo and signatures by relative path
+    monkeypatch.chdir(ROOT)
+
+
+def load_record(name):
+    with open(os.path.join(ROOT, 'tests', name)) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def fuel_record():
+    return load_record('fuel-record.json')
+
+
+@pytest.fixture
+def gate_pass_record():
+    return load_record('gate-pass-record.json')
@@ -0,0 +1,51 @@
+import pytest
+
+from batch import COMBINED, iter_render_batch, render_batch
+from fuel_card_form import FuelFormTemplate
+from stamping import PdfFile
+
+
+def trips(count, bad=None):
+    return [{'date': '05.05.2023', 'purpose': 'Trip {:} to Ndeeba'.format(number), 'distance': '10.5',
+             'rate': '5,000', 'amount': 'abc' if number == bad else '52,500'} for number in range(count)]
+
+
+@pytest.fixture
+def records(fuel_record):
+    # The middle record overflows onto further pages before failing on a trip near its end
+    failing = dict(fuel_record, business=dict(fuel_record['business'], trips=trips(80, bad=60)))
+    return [fuel_record, failing, fuel_record]
+
+
+def test_combined_failure_drops_its_pages(records, tmp_path):
+    results = render_batch(FuelFormTemplate, records, mode=COMBINED, output_dir=str(tmp_path))
+    assert [result.error is None for result in results] == [True, False, True]
+    with open(str(tmp_path / 'combined.pdf'), 'rb') as f:
+        pdf = PdfFile(f.read())
+    assert len(pdf.pages()) == 2
+
+
+def test_combined_stopped_early_leaves_no_files(records, tmp_path):
+    results = iter_render_batch(FuelFormTemplate, records, mode=COMBINED, output_dir=str(tmp_path))
+    assert next(results).error is None
+    results.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_combined_rejects_workers(records, tmp_path):
+    with pytest.raises(ValueError):
+        iter_render_batch(FuelFormTemplate, records, mode=COMBINED, output_dir=str(tmp_path), workers=2)
+
+
+def test_journal_skips_unchanged_records(fuel_record, tmp_path):
+    journal = str(tmp_path / 'journal.jsonl')
+    records = [fuel_record, dict(fuel_record, vehicle=dict(fuel_record['vehicle'], fuel_card_no='00013'))]
+    results = render_batch(FuelFormTemplate, records, output_dir=str(tmp_path), workers=1, journal=journal,
+                           threads=True)
+    assert [result.skipped for result in results] == [False, False]
+    # An edited record is rendered again even though its position is unchanged
+    records[1] = dict(records[1], vehicle=dict(records[1]['vehicle'], fuel_card_no='00014'))
+    results = render_batch(FuelFormTemplate, records, output_dir=str(tmp_path), workers=1, journal=journal,
+                           threads=True)
+    assert [result.error is None for result in results] == [True, True]
+    assert [result.skipped for result in results] == [True, False]
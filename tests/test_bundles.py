@@ -0,0 +1,45 @@
+import hashlib
+import json
+import tarfile
+import zipfile
+
+import pytest
+
+from batch import BUNDLE, render_batch
+from bundles import MANIFEST
+from fuel_card_form import FuelFormTemplate
+
+
+def read_zip(path):
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+def read_tar(path):
+    with tarfile.open(path) as archive:
+        return {member.name: archive.extractfile(member).read() for member in archive.getmembers()}
+
+
+@pytest.mark.parametrize('bundle, read', [('forms.zip', read_zip), ('forms.tar', read_tar)])
+def test_bundle_with_failed_record(fuel_record, tmp_path, bundle, read):
+    failing = dict(fuel_record, vehicle=dict(fuel_record['vehicle'], fuel_card_no='00013'),
+                   receipt=dict(fuel_record['receipt'], signature='missing.png'))
+    records = [fuel_record, failing, dict(fuel_record, vehicle=dict(fuel_record['vehicle'], fuel_card_no='00014'))]
+    results = render_batch(FuelFormTemplate, records, mode=BUNDLE, output_dir=str(tmp_path), bundle=bundle,
+                           key='vehicle.fuel_card_no', workers=1)
+    assert [result.error is None for result in results] == [True, False, True]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [bundle]
+
+    members = read(str(tmp_path / bundle))
+    assert list(members)[-1] == MANIFEST
+    manifest = [json.loads(line) for line in members[MANIFEST].decode('utf-8').splitlines()]
+    assert [entry['index'] for entry in manifest] == [0, 1, 2]
+    assert [entry['key'] for entry in manifest] == ['00012', '00013', '00014']
+    assert manifest[1] == {'index': 1, 'key': '00013', 'error': True}
+    for entry in (manifest[0], manifest[2]):
+        pdf = members[entry['filename']]
+        assert pdf.startswith(b'%PDF')
+        assert entry['size'] == len(pdf)
+        assert entry['sha256'] == hashlib.sha256(pdf).hexdigest()
+    assert len(members) == 3
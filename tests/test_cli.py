@@ -0,0 +1,66 @@
+import csv
+import json
+
+import pytest
+
+from cli import main
+
+
+def flatten(record, prefix=''):
+    columns = {}
+    for name, value in record.items():
+        if isinstance(value, dict):
+            columns.update(flatten(value, prefix + name + '.'))
+        else:
+            columns[prefix + name] = value
+    return columns
+
+
+def write_jsonl(path, fuel_record, bad_line):
+    valid = json.dumps(fuel_record)
+    path.write_text('\n'.join([valid, bad_line, valid]) + '\n', encoding='utf-8')
+
+
+def write_csv(path, fuel_record):
+    columns = flatten(fuel_record)
+    with open(str(path), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(columns))
+        writer.writerow(list(columns.values()))
+        writer.writerow(list(columns.values()) + ['extra'])
+        writer.writerow(list(columns.values()))
+
+
+@pytest.fixture(params=['malformed', 'not-object', 'extra-column'])
+def bad_input(request, fuel_record, tmp_path):
+    # An input of three records whose second is invalid, and the message expected for it
+    if request.param == 'extra-column':
+        path = tmp_path / 'forms.csv'
+        write_csv(path, fuel_record)
+        return path, '{:}:3: 1 more cells than columns'.format(path)
+    path = tmp_path / 'forms.jsonl'
+    if request.param == 'malformed':
+        write_jsonl(path, fuel_record, '{"vehicle": ')
+        return path, '{:}:2: Expecting value'.format(path)
+    write_jsonl(path, fuel_record, '[1, 2]')
+    return path, '{:}:2: expected a JSON object, not list'.format(path)
+
+
+def render(path, tmp_path, *options):
+    return main(['render', 'fuelform', '--input', str(path), '--out', str(tmp_path / 'out'), '--threads'] +
+                list(options))
+
+
+def test_invalid_record_stops_run(bad_input, tmp_path, capsys):
+    path, message = bad_input
+    assert render(path, tmp_path) == 2
+    assert message in capsys.readouterr().err
+
+
+def test_skip_invalid_renders_the_rest(bad_input, tmp_path, capsys):
+    path, message = bad_input
+    assert render(path, tmp_path, '--skip-invalid') == 0
+    err = capsys.readouterr().err
+    assert message in err
+    assert '2 records, 0 already done, 0 failed, 1 invalid' in err
+    assert sorted(p.name for p in (tmp_path / 'out').iterdir()) == ['record-00000.pdf', 'record-00001.pdf']
@@ -0,0 +1,14 @@
+import pytest
+
+from ingest import signature
+
+
+@pytest.mark.parametrize('value', ['A. Kabatesi', 'Dr. Okello', 'EMP-0042', 'signature.png'])
+def test_signature_names_and_images(value):
+    assert signature(value) == value
+
+
+@pytest.mark.parametrize('value', ['missing.png', 'scans/missing.JPG'])
+def test_missing_signature_image(value):
+    with pytest.raises(ValueError, match='does not exist'):
+        signature(value)
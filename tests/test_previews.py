@@ -0,0 +1,25 @@
+import io
+
+import pytest
+from PIL import Image
+
+from fuel_card_form import FuelFormTemplate
+from gate_pass import GatePassTemplate
+from previews import BACKEND, preview
+
+pytest.importorskip(BACKEND)
+
+
+@pytest.mark.parametrize('template_class, record', [(FuelFormTemplate, 'fuel_record'),
+                                                    (GatePassTemplate, 'gate_pass_record')])
+def test_preview(template_class, record, request):
+    dpi = 48
+    png = preview(template_class, request.getfixturevalue(record), dpi=dpi)
+    image = Image.open(io.BytesIO(png))
+    assert image.format == 'PNG'
+    width, height = template_class(response_type='bytes').canvas._pagesize
+    assert image.size == (int(width * dpi / 72 + 0.5), int(height * dpi / 72 + 0.5))
+    # The form's text and rules come out dark on white paper
+    histogram = image.convert('L').histogram()
+    dark = sum(histogram[:128])
+    assert histogram[255] > dark > image.size[0] * image.size[1] // 100
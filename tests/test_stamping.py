@@ -0,0 +1,78 @@
+import copy
+import json
+
+import pytest
+
+from fuel_card_form import FuelFormTemplate
+from stamping import PdfFile, stamp
+
+LATER = (('approval', 'checked'), ('approval', 'approved'), ('accountability', 'checked'),
+         ('accountability', 'verified'))
+
+
+@pytest.fixture
+def forms(fuel_record):
+    # A form rendered with the later signatures still to come, its stored layout, and the same form fully signed
+    pending = copy.deepcopy(fuel_record)
+    for group, officer in LATER:
+        pending[group][officer].update(signature=None, date=None)
+    template = FuelFormTemplate(response_type='bytes', invariant=True)
+    pdf = template.generate(pending)
+    layout = json.loads(json.dumps(template.layout))
+    signed = FuelFormTemplate(response_type='bytes', invariant=True)
+    return pdf, layout, signed.generate(fuel_record), signed.layout
+
+
+def signatures(fuel_record):
+    return {'{:}.{:}'.format(group, officer): {'signature': fuel_record[group][officer]['signature'],
+                                              'date': fuel_record[group][officer]['date']}
+            for group, officer in LATER}
+
+
+def test_slots_match_signed_render(forms):
+    pdf, layout, signed_pdf, signed_layout = forms
+    assert sorted(layout) == sorted(signed_layout)
+    for slot, entry in layout.items():
+        signed = signed_layout[slot]
+        assert entry['page'] == signed['page']
+        assert entry['signature'][:2] == signed['signature'][:2]
+        assert entry['date'] == signed['date']
+        assert entry['font'] == signed['font']
+
+
+def test_stamped_form_reopens(forms, fuel_record):
+    pdf, layout, signed_pdf, signed_layout = forms
+    stamped = stamp(pdf, layout, signatures(fuel_record))
+    assert stamped.startswith(pdf)
+
+    document = PdfFile(stamped)
+    assert document.trailer['Prev'] == PdfFile(pdf).startxref
+    pages = document.pages()
+    assert len(pages) == len(PdfFile(signed_pdf).pages()) == 1
+    reference, page = pages[0]
+    resources = document.object(page['Resources'])
+    images = [name for name in document.object(resources['XObject']) if name.startswith('Stamp')]
+    assert len(images) == len(LATER)
+    assert len(page['Contents']) == 3
+    update = stamped[len(pdf):]
+    for group, officer in LATER:
+        x, y = layout['{:}.{:}'.format(group, officer)]['date']
+        text = '{:.4f} {:.4f} Td ({:}) Tj'.format(x, y, fuel_record[group][officer]['date'])
+        assert text.encode() in update
+
+
+def test_stamped_form_looks_signed(forms, fuel_record):
+    fitz = pytest.importorskip('fitz')
+    pdf, layout, signed_pdf, signed_layout = forms
+    stamped = stamp(pdf, layout, signatures(fuel_record))
+
+    def pixels(data):
+        with fitz.open(stream=data, filetype='pdf') as document:
+            return document[0].get_pixmap(dpi=72).samples
+
+    expected, actual = pixels(signed_pdf), pixels(stamped)
+    assert len(expected) == len(actual)
+    # Signatures are scaled into their slots by a different path, so a few edge pixels may differ. A single
+    # missing signature and date differs in over a thousand.
+    differing = sum(1 for a, b in zip(expected, actual) if abs(a - b) > 64)
+    assert differing < 100